@@ -26,6 +26,26 @@ DATABASES = {
 # See https://docs.djangoproject.com/en/1.5/ref/settings/#allowed-hosts
 ALLOWED_HOSTS = []
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Cached pages of live tournaments expire in seconds, those of the finished ones are kept until they change.
+TOURNAMENT_LIVE_CACHE_TIMEOUT = 30
+TOURNAMENT_FINISHED_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# Share of the requests profiled by ProfilingMiddleware, off unless turned on with `manage.py profiling on`.
+TOURNAMENT_PROFILING_SAMPLE_RATE = 0.0
+# Number of the latest request profiles kept by every process.
+TOURNAMENT_PROFILING_BUFFER_SIZE = 1000
+
+# Round progressions are run by a worker thread of the web process ("thread") or by `manage.py progression_worker`
+# ("command"). Jobs running longer than the timeout in seconds are considered lost.
+TOURNAMENT_PROGRESSION_WORKER = 'thread'
+TOURNAMENT_PROGRESSION_JOB_TIMEOUT = 60 * 60
+
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
 # although not all choices may be available on all operating systems.
@@ -94,6 +114,7 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'tournament.middleware.ProfilingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
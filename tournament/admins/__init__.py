@@ -1,7 +1,10 @@
 # -*- encoding: utf-8 -*-
 import game
 import player
+import progression
+import rating
 import referee
 import round
 import score
+import standing
 import tournament
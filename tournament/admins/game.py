@@ -2,19 +2,20 @@
 from django.contrib import admin
 
 from ..models import Game, Score
-from .utils import ForbidAddMixin, get_fk_field_link, CustomStackedInline
+from .utils import ForbidAddMixin, ForbidDeleteMixin, RankStandingsMixin, get_fk_field_link, CustomStackedInline
 
 
-class ScoreInline(ForbidAddMixin, CustomStackedInline):
+class ScoreInline(ForbidAddMixin, ForbidDeleteMixin, CustomStackedInline):
     model = Score
     extra = 0
 
 
-class GameAdmin(ForbidAddMixin, admin.ModelAdmin):
+class GameAdmin(ForbidAddMixin, RankStandingsMixin, admin.ModelAdmin):
     list_display = ('__unicode__', 'white', 'black', 'winner', 'round_link', 'start_date', 'end_date')
     exclude = ('round',)
     readonly_fields = ('round_link',)
     inlines = (ScoreInline,)
+    tournament_attribute = 'round.tournament'
     search_fields = ('tournament',)
 
     round_link = get_fk_field_link('round', 'Round', 'round')
@@ -0,0 +1,44 @@
+# -*- encoding: utf-8 -*-
+from django.contrib import admin
+from django.utils.html import format_html, format_html_join
+
+from ..models import ProgressionJob, ProgressionLog
+from .utils import ForbidAddMixin, get_fk_field_link
+
+
+class ProgressionLogAdmin(ForbidAddMixin, admin.ModelAdmin):
+    list_display = ('created', 'tournament_link', 'round', 'players', 'games', 'byes', 'floaters', 'seconds',
+                    'queries', 'query_seconds')
+    list_filter = ('tournament',)
+    date_hierarchy = 'created'
+    ordering = ('-created',)
+    exclude = ('phases',)
+    readonly_fields = ('tournament', 'round', 'created', 'players', 'games', 'byes', 'floaters', 'seconds', 'queries',
+                       'query_seconds', 'phase_table')
+
+    tournament_link = get_fk_field_link('tournament', 'Tournament', 'tournament')
+
+    def phase_table(self, obj):
+        rows = format_html_join(u'', u'<tr><td style="padding-left: {0}em">{1}</td><td>{2}</td><td>{3}</td>'
+                                     u'<td>{4}</td></tr>',
+                                ((depth, name, u'%.3f' % seconds, queries, u'%.3f' % query_seconds)
+                                 for (name, depth, seconds, queries, query_seconds) in obj.get_phases()))
+        return format_html(u'<table><tr><th>Phase</th><th>Seconds</th><th>Queries</th><th>Query seconds</th></tr>'
+                           u'{0}</table>', rows)
+
+    phase_table.short_description = u'Phases'
+    phase_table.allow_tags = True
+
+
+class ProgressionJobAdmin(ForbidAddMixin, admin.ModelAdmin):
+    list_display = ('created', 'tournament_link', 'status', 'round', 'started', 'finished', 'message')
+    list_filter = ('status', 'tournament')
+    date_hierarchy = 'created'
+    ordering = ('-created',)
+    readonly_fields = ('tournament', 'status', 'round', 'message', 'created', 'started', 'finished')
+
+    tournament_link = get_fk_field_link('tournament', 'Tournament', 'tournament')
+
+
+admin.site.register(ProgressionLog, ProgressionLogAdmin)
+admin.site.register(ProgressionJob, ProgressionJobAdmin)
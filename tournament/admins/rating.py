@@ -0,0 +1,28 @@
+# -*- encoding: utf-8 -*-
+from django.contrib import admin
+
+from ..models import RatingChange, RatingSnapshot
+from .utils import ForbidAddMixin, get_fk_field_link
+
+
+class RatingChangeAdmin(ForbidAddMixin, admin.ModelAdmin):
+    list_display = ('player', 'tournament_link', 'rating_before', 'rating_after', 'rating_delta')
+    list_filter = ('tournament',)
+    search_fields = ('player__name',)
+    readonly_fields = ('tournament', 'player', 'rating_before', 'rating_after')
+
+    tournament_link = get_fk_field_link('tournament', 'Tournament', 'tournament')
+
+
+class RatingSnapshotAdmin(ForbidAddMixin, admin.ModelAdmin):
+    list_display = ('player', 'tournament_link', 'round', 'date', 'rating')
+    list_filter = ('tournament',)
+    search_fields = ('player__name',)
+    date_hierarchy = 'date'
+    readonly_fields = ('player', 'tournament', 'round', 'date', 'rating')
+
+    tournament_link = get_fk_field_link('tournament', 'Tournament', 'tournament')
+
+
+admin.site.register(RatingChange, RatingChangeAdmin)
+admin.site.register(RatingSnapshot, RatingSnapshotAdmin)
@@ -1,8 +1,17 @@
 # -*- encoding: utf-8 -*-
-from django.contrib import admin
+import json
 
+from django.conf.urls import patterns, url
+from django.contrib import admin, messages
+from django.core import urlresolvers
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+
+from ..forms import RoundResultsForm
 from ..models import Game, Round
-from .utils import ForbidAddMixin, CustomStackedInline, get_fk_field_link
+from .utils import ForbidAddMixin, CustomStackedInline, RankStandingsMixin, get_fk_field_link
 
 
 class GameInline(ForbidAddMixin, CustomStackedInline):
@@ -10,13 +19,79 @@ class GameInline(ForbidAddMixin, CustomStackedInline):
     extra = 0
 
 
-class RoundAdmin(ForbidAddMixin, admin.ModelAdmin):
-    list_display = ('name', 'tournament_link', 'games_count')
+class RoundAdmin(ForbidAddMixin, RankStandingsMixin, admin.ModelAdmin):
+    list_display = ('name', 'tournament_link', 'games_count', 'results_link')
     inlines = (GameInline,)
     exclude = ('tournament',)
-    readonly_fields = ('tournament_link',)
+    readonly_fields = ('tournament_link', 'results_link')
 
     tournament_link = get_fk_field_link('tournament', 'Tournament', 'tournament')
 
+    def results_link(self, obj):
+        return u'<a href="%s">Enter results</a>' % urlresolvers.reverse('admin:tournament_round_results',
+                                                                        args=(obj.pk,))
+
+    results_link.short_description = u'Results'
+    results_link.allow_tags = True
+
+    def get_urls(self):
+        results_view = self.admin_site.admin_view(self.results_view)
+        return patterns('',
+                        url(r'^(\d+)/results/$', results_view, name='tournament_round_results'),
+                        url(r'^(\d+)/results\.json$', results_view, {'as_json': True},
+                            name='tournament_round_results_json')) + super(RoundAdmin, self).get_urls()
+
+    def results_view(self, request, object_id, as_json=False):
+        """
+        Bulk result entry of all the games of the round. The JSON endpoint accepts
+        { "results": { game id: result }, "finish_round": bool } with the results in the PGN notation.
+        """
+        current_round = get_object_or_404(Round.objects.select_related('tournament'), pk=object_id)
+        if not self.has_change_permission(request, current_round):
+            raise PermissionDenied
+        games = list(current_round.game_set.select_related('white', 'black').order_by('id'))
+
+        if request.method != 'POST':
+            form = RoundResultsForm(games, initial={'finish_round': current_round.finished})
+        elif as_json:
+            try:
+                payload = json.loads(request.body)
+                form = RoundResultsForm(games, RoundResultsForm.get_data(games, payload))
+            except ValueError, e:
+                return self.json_response({'errors': {'__all__': [unicode(e)]}}, status=400)
+        else:
+            form = RoundResultsForm(games, request.POST)
+
+        if form.is_bound and form.is_valid():
+            changes = form.get_changes()
+            try:
+                current_round.tournament.update_results(current_round, changes, form.cleaned_data['finish_round'])
+            except UserWarning, e:
+                if as_json:
+                    return self.json_response({'errors': {'__all__': [unicode(e)]}}, status=400)
+                self.message_user(request, e, level=messages.ERROR)
+            else:
+                if as_json:
+                    return self.json_response({'updated': len(changes), 'finished': current_round.finished})
+                self.message_user(request, u'%d game results updated' % len(changes))
+                return redirect(urlresolvers.reverse('admin:tournament_round_change', args=(current_round.pk,)))
+
+        if as_json:
+            if form.is_bound:
+                return self.json_response({'errors': form.errors}, status=400)
+            return self.json_response({
+                'results': dict((game.pk, Game.get_result(game.finished, game.winner)) for game in games),
+                'finished': current_round.finished
+            })
+        return TemplateResponse(request, 'admin/round_results.html', {
+            'title': u'Results of %s' % current_round,
+            'opts': self.model._meta,
+            'original': current_round,
+            'form': form
+        }, current_app=self.admin_site.name)
+
+    def json_response(self, payload, status=200):
+        return HttpResponse(json.dumps(payload), content_type='application/json', status=status)
+
 
 admin.site.register(Round, RoundAdmin)
@@ -2,10 +2,10 @@
 from django.contrib import admin
 
 from ..models import Score
-from .utils import ForbidAddMixin
+from .utils import ForbidAddMixin, ForbidDeleteMixin, RankStandingsMixin
 
 
-class ScoreAdmin(ForbidAddMixin, admin.ModelAdmin):
-    pass
+class ScoreAdmin(ForbidAddMixin, ForbidDeleteMixin, RankStandingsMixin, admin.ModelAdmin):
+    tournament_attribute = 'game.round.tournament'
 
 admin.site.register(Score, ScoreAdmin)
@@ -0,0 +1,18 @@
+# -*- encoding: utf-8 -*-
+from django.contrib import admin
+
+from ..models import Standing
+from .utils import ForbidAddMixin, get_fk_field_link
+
+
+class StandingAdmin(ForbidAddMixin, admin.ModelAdmin):
+    list_display = ('rank', 'player', 'tournament_link', 'points', 'games_played', 'color_balance', 'rating_delta')
+    list_filter = ('tournament',)
+    search_fields = ('player__name',)
+    ordering = ('tournament', 'rank')
+    readonly_fields = ('tournament', 'player', 'points', 'games_played', 'whites', 'blacks', 'rating_delta', 'rank')
+
+    tournament_link = get_fk_field_link('tournament', 'Tournament', 'tournament')
+
+
+admin.site.register(Standing, StandingAdmin)
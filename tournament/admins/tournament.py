@@ -1,8 +1,17 @@
 # -*- encoding: utf-8 -*-
+import json
+
+from django.conf.urls import patterns, url
 from django.contrib import admin, messages
 from django.core import urlresolvers
-
-from ..models import Round, RefereeProfile, Tournament
+from django.core.exceptions import PermissionDenied
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.html import format_html
+
+from .. import jobs
+from ..models import JobStatuses, Round, RefereeProfile, Tournament
 from .utils import ChangeFormActionsMixin, CustomStackedInline, ForbidAddMixin, \
     change_form_action, get_fk_field_link, owner_required
 
@@ -18,11 +27,14 @@ class TournamentAdmin(ChangeFormActionsMixin, admin.ModelAdmin):
     search_fields = ('name',)
     filter_horizontal = ('players',)
     create_only_fields = ('players', 'referee')
-    readonly_fields = ('player_list', 'referee_link')
-    change_only_fields = ('player_list', 'referee_link')
+    readonly_fields = ('player_list', 'referee_link', 'progression_status', 'progression_logs_link')
+    change_only_fields = ('player_list', 'referee_link', 'progression_status', 'progression_logs_link')
     inlines = (RoundInline,)
     actions = ('next_round',)
 
+    class Media:
+        js = ('admin/js/progression.js',)
+
     def get_readonly_fields(self, request, obj=None):
         readonly_fields = super(TournamentAdmin, self).get_readonly_fields(request, obj)
         if obj is None and readonly_fields is not None:
@@ -48,6 +60,47 @@ class TournamentAdmin(ChangeFormActionsMixin, admin.ModelAdmin):
 
     referee_link = get_fk_field_link('refereeprofile', u'Referee', 'referee')
 
+    def progression_logs_link(self, obj):
+        return u'<a href="%s?tournament__id__exact=%s">%d progressions logged</a>' % (
+            urlresolvers.reverse('admin:tournament_progressionlog_changelist'), obj.pk, obj.progressionlog_set.count())
+
+    progression_logs_link.short_description = u'Round generation history'
+    progression_logs_link.allow_tags = True
+
+    def progression_status(self, obj):
+        job = jobs.get_latest_job(obj)
+        if job is None:
+            return u'-'
+        return format_html(u'<span id="progression-status" data-url="{0}" data-status="{1}">{2}</span>',
+                           urlresolvers.reverse('admin:tournament_tournament_progression', args=(obj.pk,)),
+                           job.status, self.describe_job(job))
+
+    progression_status.short_description = u'Next round'
+
+    def describe_job(self, job):
+        if job.status == JobStatuses.FAILED:
+            return u'Failed: %s' % job.message
+        elif job.status == JobStatuses.DONE and job.round_id is not None:
+            return u'Done: %s started' % job.round.name
+        elif job.status == JobStatuses.DONE:
+            return u'Done: the tournament is finished'
+        return job.get_status_display()
+
+    def get_urls(self):
+        return patterns('', url(r'^(\d+)/progression/$', self.admin_site.admin_view(self.progression_view),
+                                name='tournament_tournament_progression')) + super(TournamentAdmin, self).get_urls()
+
+    def progression_view(self, request, object_id):
+        """
+        Returns status of the latest progression job of the tournament as JSON, polled by the change form.
+        """
+        tournament = get_object_or_404(Tournament.objects.select_related('referee__user'), pk=object_id)
+        if not self.has_change_permission(request, tournament):
+            raise PermissionDenied
+        job = jobs.get_latest_job(tournament)
+        payload = dict(job.as_dict(), description=self.describe_job(job)) if job is not None else None
+        return HttpResponse(json.dumps(payload, cls=DjangoJSONEncoder), content_type='application/json')
+
     @owner_required('referee.user')
     def has_change_permission(self, request, obj=None):
         return super(TournamentAdmin, self).has_change_permission(request, obj)
@@ -58,10 +111,13 @@ class TournamentAdmin(ChangeFormActionsMixin, admin.ModelAdmin):
 
     @change_form_action
     def next_round(self, request, queryset):
+        tournament = next(queryset.iterator())
         try:
-            next(queryset.iterator()).progress()
+            job = jobs.submit(tournament)
         except UserWarning, e:
             self.message_user(request, e, level=messages.ERROR)
+        else:
+            self.message_user(request, u'Next round of "%s" is %s' % (tournament, job.get_status_display().lower()))
 
 
 admin.site.register(Tournament, TournamentAdmin)
@@ -37,6 +37,20 @@ class ChangeFormActionsMixin(AdminURLMixin):
         })
 
 
+class RankStandingsMixin(object):
+    """
+    Re-ranks the standings of the tournament once the object and all its inlines are saved, as saving a game or a
+    score only updates the standings of its players.
+    """
+    tournament_attribute = 'tournament'
+
+    def save_related(self, request, form, formsets, change):
+        super(RankStandingsMixin, self).save_related(request, form, formsets, change)
+        tournament = get_deep_attr(form.instance, self.tournament_attribute)
+        tournament.update_ranks()
+        tournament.touch()
+
+
 class ForbidAddMixin(object):
     def has_add_permission(self, request, obj=None):
         return False
@@ -0,0 +1,82 @@
+# -*- encoding: utf-8 -*-
+"""
+Read-only JSON API of the tournaments.
+Lists of objects are serialized as { "fields": [...], "rows": [[...], ...] } to keep the payloads compact.
+Every response carries an ETag made of the tournament version, so conditional requests of the unchanged tournaments
+are answered with 304 after a single query over the tournaments table. The version is incremented by every change of
+the tournament, its results and its players, and the views never write, so the ETag sent is never stale.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import condition, require_GET
+
+from .models import Game, Round, Standing, Tournament
+
+API_VERSION = 1
+
+
+def get_etag(request, pk, *args, **kwargs):
+    version = next(iter(Tournament.objects.filter(pk=pk).values_list('version', flat=True)), None)
+    if version is None:
+        raise Http404()
+    return '%s-%s-%s' % (API_VERSION, pk, version)
+
+
+def api_view(view):
+    return require_GET(condition(etag_func=get_etag)(view))
+
+
+def json_response(payload):
+    return HttpResponse(json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')),
+                        content_type='application/json')
+
+
+def get_rows(queryset, fields):
+    return {'fields': fields, 'rows': [list(row) for row in queryset.values_list(*fields)]}
+
+
+@api_view
+def tournament(request, pk):
+    tournaments = Tournament.objects.filter(pk=pk).annotate(players_count=models.Count('players', distinct=True),
+                                                           rounds_count=models.Count('round', distinct=True))
+    summary = next(iter(tournaments.values('id', 'name', 'start_date', 'end_date', 'finished', 'pairing', 'version',
+                                           'players_count', 'rounds_count', 'referee__user__username',
+                                           'referee__user__first_name', 'referee__user__last_name')), None)
+    if summary is None:
+        raise Http404()
+
+    referee = u' '.join((summary.pop('referee__user__first_name'), summary.pop('referee__user__last_name')))
+    username = summary.pop('referee__user__username')
+    summary.update(referee=referee if not referee.isspace() else username)
+    return json_response(summary)
+
+
+@api_view
+def rounds(request, pk):
+    queryset = Round.objects.filter(tournament=pk).annotate(games_count=models.Count('game')) \
+        .order_by('start_date', 'id')
+    return json_response(get_rows(queryset, ['id', 'name', 'start_date', 'end_date', 'finished', 'games_count']))
+
+
+@api_view
+def pairings(request, pk, round_pk):
+    if not Round.objects.filter(pk=round_pk, tournament=pk).exists():
+        raise Http404()
+
+    fields = ['id', 'white', 'white__name', 'white__rating', 'black', 'black__name', 'black__rating', 'finished',
+              'winner']
+    payload = get_rows(Game.objects.filter(round=round_pk).order_by('id'), fields)
+    payload['fields'] = fields + ['result']
+    for row in payload['rows']:
+        row.append(Game.get_result(row[fields.index('finished')], row[fields.index('winner')]))
+    return json_response(payload)
+
+
+@api_view
+def standings(request, pk):
+    fields = ['rank', 'player', 'player__name', 'player__country', 'player__rating', 'points', 'games_played',
+              'whites', 'blacks', 'rating_delta']
+    return json_response(get_rows(Standing.objects.filter(tournament=pk).order_by('rank'), fields))
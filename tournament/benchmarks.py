@@ -0,0 +1,230 @@
+# -*- encoding: utf-8 -*-
+"""
+Benchmarks of the tournament hot paths. Run them with `manage.py benchmark`.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import math
+import random
+import sys
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core import cache as django_cache
+from django.test.client import RequestFactory
+import numpy
+
+from .models import Game, Player
+from .pairing import MatchingPairing, SwissPairing, TournamentState
+from .profiling import Phase
+from .simulation import TournamentSimulation
+from .tournament import get_elo_changes, update_column
+from .views import TournamentDetailView
+
+PAIRING_ENGINES = (
+    ('greedy', SwissPairing),
+    ('matching', MatchingPairing),
+)
+
+
+def build_state(players_count, rng):
+    """
+    Returns state of a tournament which is about to start, with normally distributed player ratings.
+    :rtype: TournamentState
+    """
+    ids = range(1, players_count + 1)
+    return TournamentState(ids=ids, scores=[0.0] * players_count, ratings=[int(rng.gauss(1800, 300)) for i in ids])
+
+
+def play_round(state, pairs, rng):
+    """
+    Plays out the round in the state: results of the games are drawn at random, bye is a win.
+    :param pairs: list of (white id, black id) pairs
+    :type pairs: list
+    """
+    for (white, black) in pairs:
+        if white is None or black is None:
+            state.scores[state.indexes[white if black is None else black]] += 1.0
+            continue
+        state.add_game(white, black)
+        white, black = state.indexes[white], state.indexes[black]
+        score = rng.choice((0.0, 0.5, 1.0))
+        state.scores[white] += score
+        state.scores[black] += 1.0 - score
+
+
+def get_rounds_count(players_count):
+    return int(2 * round(math.log(players_count, 2)))
+
+
+def benchmark_pairing(players_counts, seed=0):
+    """
+    Plays the whole tournament out with every pairing engine, measuring time spent on pairing and quality
+    of the pairings: number of byes and floaters (players paired outside of their score group).
+    :param players_counts: tournament sizes
+    :type players_counts: Iterable
+    :rtype: list
+    """
+    results = []
+    for players_count in players_counts:
+        for (name, engine_class) in PAIRING_ENGINES:
+            rng = random.Random(seed)
+            state = build_state(players_count, rng)
+            rounds = get_rounds_count(players_count)
+            seconds = byes = floaters = 0
+
+            for i in xrange(rounds):
+                started = time.time()
+                pairs = engine_class(state, rng).pair()
+                seconds += time.time() - started
+
+                for (white, black) in pairs:
+                    if white is None or black is None:
+                        byes += 1
+                    elif state.scores[state.indexes[white]] != state.scores[state.indexes[black]]:
+                        floaters += 2
+                play_round(state, pairs, rng)
+
+            results.append(OrderedDict((
+                ('benchmark', 'pairing'),
+                ('engine', name),
+                ('players', players_count),
+                ('rounds', rounds),
+                ('seconds_per_round', seconds / rounds),
+                ('byes', byes),
+                ('floaters', floaters),
+            )))
+    return results
+
+
+def benchmark_elo(games_counts, seed=0):
+    """
+    Computes rating deltas of random games both game by game and as a single batch, comparing the time spent
+    and checking the results are the same.
+    :param games_counts: numbers of games
+    :type games_counts: Iterable
+    :rtype: list
+    """
+    results = []
+    for games_count in games_counts:
+        rng = random.Random(seed)
+        game = Game()
+        players = [Player(rating=int(rng.gauss(1800, 300))) for i in xrange(2 * games_count)]
+        sides = [(players[i], players[i + 1] if rng.random() > 0.01 else None, rng.choice((0.0, 0.5, 1.0)))
+                 for i in xrange(0, len(players), 2)]
+
+        started = time.time()
+        scalar_deltas = [game.get_rating_delta(player, opponent, score) for (player, opponent, score) in sides]
+        scalar_seconds = time.time() - started
+
+        ratings = numpy.array([player.rating for (player, opponent, score) in sides])
+        opponent_ratings = numpy.array([opponent.rating if opponent is not None else numpy.nan
+                                        for (player, opponent, score) in sides])
+        k_factors = numpy.array([game.get_k(player) for (player, opponent, score) in sides])
+        scores = numpy.array([score for (player, opponent, score) in sides])
+
+        started = time.time()
+        expectations, deltas = get_elo_changes(ratings, opponent_ratings, k_factors, scores)
+        batch_seconds = time.time() - started
+
+        results.append(OrderedDict((
+            ('benchmark', 'elo'),
+            ('games', games_count),
+            ('scalar_seconds', scalar_seconds),
+            ('batch_seconds', batch_seconds),
+            ('max_difference', float(numpy.max(numpy.abs(deltas - scalar_deltas))) if sides else 0.0),
+        )))
+    return results
+
+
+@contextmanager
+def private_cache():
+    """
+    Replaces the default cache with a private local memory one for the duration of the block, both in Django and in
+    the modules of this application holding it, so the benchmarks neither read nor flush a cache shared with the
+    project.
+    """
+    default = django_cache.cache
+    private = django_cache.get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='tournament-benchmark')
+    modules = [module for (name, module) in sys.modules.items()
+               if (name == 'django.core.cache' or name.startswith('tournament.')) and module is not None and
+               getattr(module, 'cache', None) is default]
+    for module in modules:
+        module.cache = private
+    try:
+        yield private
+    finally:
+        private.clear()
+        for module in modules:
+            module.cache = default
+
+
+def render_detail(tournament):
+    request = RequestFactory().get('/')
+    request.user = AnonymousUser()
+    return TournamentDetailView.as_view()(request, pk=tournament.pk)
+
+
+def benchmark_tournament(players_counts, seed=0, rounds=3):
+    """
+    Measures the database backed stages of the tournament: pairing the next round, resolving the colors, scoring
+    the round, rendering the tournament page, updating the ratings and finishing the tournament. Every tournament
+    is simulated with TournamentSimulation up to the given round first. Requires a database the tournaments can be
+    created in, the cache is replaced with a private one.
+    :param players_counts: tournament sizes
+    :type players_counts: Iterable
+    :param rounds: number of the rounds played before the measurements
+    :type rounds: int
+    :rtype: list
+    """
+    with private_cache():
+        return [result for players_count in players_counts
+                for result in benchmark_tournament_size(players_count, seed, rounds)]
+
+
+def benchmark_tournament_size(players_count, seed, rounds):
+    """
+    Measures the stages of a single tournament of the given size, see benchmark_tournament.
+    :rtype: list
+    """
+    results = []
+    tournament = TournamentSimulation(players_count, seed=seed, rounds=rounds).run()
+    current_round = tournament.get_latest_round()
+    state = tournament.get_pairing_state()
+    pairs = [(state.indexes[white], state.indexes[black]) for (white, black) in tournament.pair_players(seed=seed)
+             if white is not None and black is not None]
+    engine = tournament.get_pairing_engine(state, seed)
+    ratings = [(rating, player_id) for (player_id, rating) in tournament.players.values_list('id', 'rating')]
+
+    operations = (
+        ('pair_players', lambda: tournament.pair_players(seed=seed)),
+        ('map_colors', lambda: map(engine.map_colors, pairs)),
+        ('update_round_scores', lambda: tournament.update_round_scores(current_round)),
+        ('detail_view', lambda: render_detail(tournament)),
+        ('detail_view_cached', lambda: render_detail(tournament)),
+        ('update_ratings', tournament.update_ratings),
+        ('finish_tournament', tournament.finish_tournament),
+    )
+    for (name, operation) in operations:
+        if name == 'finish_tournament':
+            # The ratings updated by the previous operation are restored, so they are not updated twice.
+            update_column(Player, 'rating', ratings)
+        with Phase(name) as phase:
+            operation()
+        results.append(OrderedDict((
+            ('benchmark', 'tournament'),
+            ('operation', name),
+            ('players', players_count),
+            ('seconds', phase.seconds),
+            ('queries', phase.queries),
+        )))
+    return results
+
+
+# Benchmark functions by name, along with the command option giving the sizes to run them with and whether they
+# need a database.
+BENCHMARKS = OrderedDict((
+    ('pairing', (benchmark_pairing, 'players', False)),
+    ('elo', (benchmark_elo, 'games', False)),
+    ('tournament', (benchmark_tournament, 'tournament_players', True)),
+))
@@ -0,0 +1,53 @@
+# -*- encoding: utf-8 -*-
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Pages of live tournaments may depend on changes no signal is sent for, so they are cached shortly.
+LIVE_TIMEOUT = getattr(settings, 'TOURNAMENT_LIVE_CACHE_TIMEOUT', 30)
+# Memcached treats timeouts longer than 30 days as timestamps, so this is as long as "forever" gets.
+FINISHED_TIMEOUT = getattr(settings, 'TOURNAMENT_FINISHED_CACHE_TIMEOUT', 60 * 60 * 24 * 30)
+
+LIST_GENERATION_KEY = 'tournament:list:generation'
+
+
+def get_timeout(tournament):
+    return FINISHED_TIMEOUT if tournament.finished else LIVE_TIMEOUT
+
+
+def get_detail_key(tournament):
+    """
+    Returns cache key of the tournament page, which changes with every change of the tournament.
+    :type tournament: Tournament
+    :rtype: str
+    """
+    return 'tournament:detail:%s:%s' % (tournament.pk, tournament.version)
+
+
+def get_list_key(query):
+    """
+    Returns cache key of the tournament list page, which changes with every change of any tournament.
+    :param query: query string of the page
+    :type query: basestring
+    :rtype: str
+    """
+    return 'tournament:list:%s:%s' % (get_list_generation(), hashlib.md5(query.encode('utf-8')).hexdigest())
+
+
+def get_list_generation():
+    generation = cache.get(LIST_GENERATION_KEY)
+    if generation is None:
+        # A new generation never reuses the numbers of the evicted one.
+        generation = int(time.time())
+        cache.add(LIST_GENERATION_KEY, generation, FINISHED_TIMEOUT)
+    return generation
+
+
+def invalidate_list():
+    try:
+        cache.incr(LIST_GENERATION_KEY)
+    except ValueError:
+        # Nothing is cached under the missing generation.
+        pass
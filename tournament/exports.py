@@ -0,0 +1,157 @@
+# -*- encoding: utf-8 -*-
+"""
+Streaming exports of the tournament games.
+Every exporter is a generator of text chunks over an iterable of tournaments. Games are read with a cursor per
+tournament, so the memory used is bounded by the size of the largest tournament, not by the size of the export.
+"""
+import csv
+
+from .fide import COUNTRY_FEDERATIONS
+from .models import Game, Score, Scores, Side, Standing
+
+CSV_FIELDS = ('tournament', 'round', 'date', 'white', 'white_rating', 'black', 'black_rating', 'result')
+GAME_FIELDS = ('round', 'start_date', 'white__name', 'white__rating', 'black__name', 'black__rating', 'finished',
+               'winner')
+TRF_RESULTS = {Scores.WIN: u'1', Scores.DRAW: u'=', Scores.DEFEAT: u'0'}
+
+
+class Formats(object):
+    PGN = 'pgn'
+    CSV = 'csv'
+    TRF = 'trf'
+
+
+def get_round_numbers(tournament):
+    return dict((round_id, i) for (i, round_id)
+                in enumerate(tournament.round_set.order_by('start_date', 'id').values_list('id', flat=True), 1))
+
+
+def get_games(tournament):
+    """
+    Returns cursor over the tournament games, as GAME_FIELDS tuples.
+    :rtype: Iterable
+    """
+    return Game.objects.filter(round__tournament=tournament).order_by('round', 'id') \
+        .values_list(*GAME_FIELDS).iterator()
+
+
+def quote_pgn(value):
+    return u'"%s"' % unicode(value).replace(u'\\', u'\\\\').replace(u'"', u'\\"')
+
+
+def export_pgn(tournaments):
+    """
+    Exports the games as PGN headers followed by the game result. Byes are not exported.
+    :param tournaments: tournaments to export
+    :type tournaments: Iterable
+    :rtype: Iterable
+    """
+    for tournament in tournaments:
+        round_numbers = get_round_numbers(tournament)
+        for (round_id, date, white, white_rating, black, black_rating, finished, winner) in get_games(tournament):
+            if white is None or black is None:
+                continue
+            result = Game.get_result(finished, winner)
+            headers = (('Event', tournament.name), ('Site', '?'), ('Date', date.strftime('%Y.%m.%d')),
+                       ('Round', round_numbers[round_id]), ('White', white), ('Black', black),
+                       ('Result', result), ('WhiteElo', white_rating), ('BlackElo', black_rating))
+            yield u''.join(u'[%s %s]\n' % (name, quote_pgn(value)) for (name, value) in headers) + \
+                u'\n%s\n\n' % result
+
+
+class Line(object):
+    """
+    File-like object returning the written line decoded, so the CSV writer can be used in a generator.
+    """
+
+    def write(self, value):
+        return value.decode('utf-8')
+
+
+def export_csv(tournaments):
+    """
+    Exports the games as CSV rows, byes have the black player missing.
+    :param tournaments: tournaments to export
+    :type tournaments: Iterable
+    :rtype: Iterable
+    """
+    writer = csv.writer(Line())
+    yield writer.writerow(CSV_FIELDS)
+    for tournament in tournaments:
+        round_numbers = get_round_numbers(tournament)
+        name = tournament.name.encode('utf-8')
+        for (round_id, date, white, white_rating, black, black_rating, finished, winner) in get_games(tournament):
+            yield writer.writerow((name, round_numbers[round_id], date.strftime('%Y-%m-%d'),
+                                   (white or u'').encode('utf-8'), white_rating,
+                                   (black or u'').encode('utf-8'), black_rating,
+                                   Game.get_result(finished, winner)))
+
+
+def export_trf(tournaments):
+    """
+    Exports the tournaments in the FIDE Tournament Report File format: header records and a player record with
+    the results of all the rounds for every player. Federations are exported as FIDE codes of the players countries,
+    left blank for the countries without a FIDE federation.
+    :param tournaments: tournaments to export
+    :type tournaments: Iterable
+    :rtype: Iterable
+    """
+    for tournament in tournaments:
+        players = list(tournament.players.order_by('-rating', 'name', 'id')
+                       .values_list('id', 'name', 'rating', 'country', 'fide_id'))
+        start_ranks = dict((player[0], i) for (i, player) in enumerate(players, 1))
+        round_numbers = get_round_numbers(tournament)
+        standings = dict((player_id, (points, rank)) for (player_id, points, rank)
+                         in Standing.objects.filter(tournament=tournament).values_list('player', 'points', 'rank'))
+
+        results = dict((player_id, {}) for player_id in start_ranks)
+        scores = Score.objects.filter(game__round__tournament=tournament) \
+            .values_list('game__round', 'game__white', 'game__black', 'game__finished', 'player', 'side', 'score')
+        for (round_id, white, black, finished, player_id, side, score) in scores.iterator():
+            opponent = black if side == Side.WHITE else white
+            if opponent is None:
+                result = u'0000 - U'
+            else:
+                color = u'w' if side == Side.WHITE else u'b'
+                code = TRF_RESULTS.get(score, u' ') if finished else u' '
+                result = u'%4s %s %s' % (start_ranks.get(opponent, 0), color, code)
+            results.setdefault(player_id, {})[round_numbers[round_id]] = result
+
+        yield u'012 %s\n' % tournament.name
+        yield u'042 %s\n' % tournament.start_date.strftime('%Y/%m/%d')
+        if tournament.end_date is not None:
+            yield u'052 %s\n' % tournament.end_date.strftime('%Y/%m/%d')
+        yield u'062 %s\n' % len(players)
+        yield u'092 Swiss System\n'
+        yield u'102 %s\n' % tournament.referee
+
+        for (player_id, name, rating, country, fide_id) in players:
+            points, rank = standings.get(player_id, (0.0, None))
+            rounds = u''.join(u'  %s' % results[player_id].get(number, u' ' * 8)
+                              for number in xrange(1, len(round_numbers) + 1))
+            yield (u'001 %4d  %3s %-33.33s %4d %3s %11s %10s %4.1f %4s%s' % (
+                start_ranks[player_id], u'', name, rating, COUNTRY_FEDERATIONS.get(country, u''), fide_id or u'',
+                u'', points, rank or u'', rounds)).rstrip() + u'\n'
+        yield u'\n'
+
+
+EXPORTERS = {
+    Formats.PGN: (export_pgn, 'application/x-chess-pgn'),
+    Formats.CSV: (export_csv, 'text/csv'),
+    Formats.TRF: (export_trf, 'text/plain'),
+}
+
+
+def export(tournaments, export_format):
+    """
+    Exports the tournaments in the given format.
+    :param tournaments: tournaments queryset
+    :type tournaments: QuerySet
+    :param export_format: one of Formats
+    :type export_format: str
+    :returns: (chunks iterable, content type) tuple
+    :rtype: tuple
+    """
+    exporter, content_type = EXPORTERS[export_format]
+    tournaments = tournaments.select_related('referee__user').order_by('start_date', 'id').iterator()
+    return exporter(tournaments), content_type
@@ -0,0 +1,265 @@
+# -*- encoding: utf-8 -*-
+"""
+Import of the FIDE rating list, either the fixed width TXT or the XML one, optionally zipped.
+"""
+from collections import OrderedDict, defaultdict, namedtuple
+import os
+import re
+import time
+import zipfile
+from xml.etree import cElementTree
+
+from django.db import transaction
+
+from .models import Player, Tournament
+from .tournament import chunked, update_columns
+
+FideRecord = namedtuple('FideRecord', ('fide_id', 'name', 'country', 'rating', 'games'))
+
+# FIDE federations by their ISO 3166 country codes, federations without one are not imported.
+FEDERATIONS = {
+    'AFG': 'AF', 'ALB': 'AL', 'ALG': 'DZ', 'AND': 'AD', 'ANG': 'AO', 'ANT': 'AG', 'ARG': 'AR', 'ARM': 'AM',
+    'ARU': 'AW', 'AUS': 'AU', 'AUT': 'AT', 'AZE': 'AZ', 'BAH': 'BS', 'BAN': 'BD', 'BAR': 'BB', 'BDI': 'BI',
+    'BEL': 'BE', 'BER': 'BM', 'BHU': 'BT', 'BIH': 'BA', 'BIZ': 'BZ', 'BLR': 'BY', 'BOL': 'BO', 'BOT': 'BW',
+    'BRA': 'BR', 'BRN': 'BH', 'BRU': 'BN', 'BUL': 'BG', 'BUR': 'BF', 'CAF': 'CF', 'CAM': 'KH', 'CAN': 'CA',
+    'CAY': 'KY', 'CGO': 'CG', 'CHA': 'TD', 'CHI': 'CL', 'CHN': 'CN', 'CIV': 'CI', 'CMR': 'CM', 'COD': 'CD',
+    'COL': 'CO', 'COM': 'KM', 'CPV': 'CV', 'CRC': 'CR', 'CRO': 'HR', 'CUB': 'CU', 'CYP': 'CY', 'CZE': 'CZ',
+    'DEN': 'DK', 'DJI': 'DJ', 'DMA': 'DM', 'DOM': 'DO', 'ECU': 'EC', 'EGY': 'EG', 'ENG': 'GB', 'ERI': 'ER',
+    'ESA': 'SV', 'ESP': 'ES', 'EST': 'EE', 'ETH': 'ET', 'FAI': 'FO', 'FIJ': 'FJ', 'FIN': 'FI', 'FRA': 'FR',
+    'GAB': 'GA', 'GAM': 'GM', 'GCI': 'GG', 'GEO': 'GE', 'GEQ': 'GQ', 'GER': 'DE', 'GHA': 'GH', 'GRE': 'GR',
+    'GRN': 'GD', 'GUA': 'GT', 'GUM': 'GU', 'GUY': 'GY', 'HAI': 'HT', 'HKG': 'HK', 'HON': 'HN', 'HUN': 'HU',
+    'INA': 'ID', 'IND': 'IN', 'IOM': 'IM', 'IRI': 'IR', 'IRL': 'IE', 'IRQ': 'IQ', 'ISL': 'IS', 'ISR': 'IL',
+    'ISV': 'VI', 'ITA': 'IT', 'IVB': 'VG', 'JAM': 'JM', 'JCI': 'JE', 'JOR': 'JO', 'JPN': 'JP', 'KAZ': 'KZ',
+    'KEN': 'KE', 'KGZ': 'KG', 'KOR': 'KR', 'KSA': 'SA', 'KUW': 'KW', 'LAO': 'LA', 'LAT': 'LV', 'LBA': 'LY',
+    'LBN': 'LB', 'LBR': 'LR', 'LCA': 'LC', 'LES': 'LS', 'LIE': 'LI', 'LTU': 'LT', 'LUX': 'LU', 'MAC': 'MO',
+    'MAD': 'MG', 'MAR': 'MA', 'MAS': 'MY', 'MAW': 'MW', 'MDA': 'MD', 'MDV': 'MV', 'MEX': 'MX', 'MGL': 'MN',
+    'MKD': 'MK', 'MLI': 'ML', 'MLT': 'MT', 'MNC': 'MC', 'MNE': 'ME', 'MOZ': 'MZ', 'MRI': 'MU', 'MTN': 'MR',
+    'MYA': 'MM', 'NAM': 'NA', 'NCA': 'NI', 'NED': 'NL', 'NEP': 'NP', 'NGR': 'NG', 'NIG': 'NE', 'NOR': 'NO',
+    'NZL': 'NZ', 'OMA': 'OM', 'PAK': 'PK', 'PAN': 'PA', 'PAR': 'PY', 'PER': 'PE', 'PHI': 'PH', 'PLE': 'PS',
+    'PLW': 'PW', 'PNG': 'PG', 'POL': 'PL', 'POR': 'PT', 'PUR': 'PR', 'QAT': 'QA', 'ROU': 'RO', 'RSA': 'ZA',
+    'RUS': 'RU', 'RWA': 'RW', 'SCO': 'GB', 'SEN': 'SN', 'SEY': 'SC', 'SGP': 'SG', 'SKN': 'KN', 'SLE': 'SL',
+    'SLO': 'SI', 'SMR': 'SM', 'SOL': 'SB', 'SOM': 'SO', 'SRB': 'RS', 'SRI': 'LK', 'SSD': 'SS', 'STP': 'ST',
+    'SUD': 'SD', 'SUI': 'CH', 'SUR': 'SR', 'SVK': 'SK', 'SWE': 'SE', 'SWZ': 'SZ', 'SYR': 'SY', 'TAN': 'TZ',
+    'TJK': 'TJ', 'TKM': 'TM', 'TLS': 'TL', 'TOG': 'TG', 'TPE': 'TW', 'TTO': 'TT', 'TUN': 'TN', 'TUR': 'TR',
+    'UAE': 'AE', 'UGA': 'UG', 'UKR': 'UA', 'URU': 'UY', 'USA': 'US', 'UZB': 'UZ', 'VAN': 'VU', 'VEN': 'VE',
+    'VIE': 'VN', 'VIN': 'VC', 'WLS': 'GB', 'YEM': 'YE', 'ZAM': 'ZM', 'ZIM': 'ZW',
+}
+# FIDE federations by ISO 3166 country code, for the reports. Great Britain has three, its players are reported as
+# English.
+COUNTRY_FEDERATIONS = dict((country, federation) for (federation, country) in FEDERATIONS.iteritems())
+COUNTRY_FEDERATIONS['GB'] = 'ENG'
+
+
+class Formats(object):
+    TXT = 'txt'
+    XML = 'xml'
+
+
+# Header labels of the TXT list columns, the rating and games ones differ between the list editions.
+TXT_COLUMNS = (
+    ('fide_id', ('ID Number',)),
+    ('name', ('Name',)),
+    ('country', ('Fed',)),
+    ('rating', ('SRtng', 'Rating')),
+    ('games', ('SGm', 'Gms')),
+)
+# Older lists label the rating column with the list month, like "MAR13".
+TXT_MONTH_LABEL = re.compile(r'(?<!\S)[A-Za-z]{3}\d{2}(?!\S)')
+
+
+def to_int(value):
+    value = value.strip()
+    return int(value) if value else None
+
+
+def get_record(fide_id, name, country, rating, games):
+    """
+    Returns record of the raw list values, None if the FIDE id is missing or any number is malformed.
+    :rtype: FideRecord
+    """
+    try:
+        return FideRecord(fide_id=int(fide_id), name=name.strip(), country=country.strip(), rating=to_int(rating),
+                          games=to_int(games))
+    except (TypeError, ValueError):
+        return None
+
+
+def decode(value):
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return value.decode('latin-1')
+
+
+def find_label(header, labels):
+    for label in labels:
+        start = header.find(label)
+        if start != -1:
+            return start, start + len(label)
+    return None
+
+
+def get_txt_columns(header):
+    """
+    Returns (name, start, end) spans of the known columns of the TXT list: a column spans from its header label
+    to the label of the next one.
+    :rtype: list
+    """
+    starts = [match.start() for match in re.finditer(r'\S+', header)]
+    columns = []
+    for (name, labels) in TXT_COLUMNS:
+        span = find_label(header, labels)
+        if span is None and name == 'rating':
+            match = TXT_MONTH_LABEL.search(header)
+            span = match.span() if match is not None else None
+        if span is None:
+            if name in ('fide_id', 'rating'):
+                raise UserWarning(u'Unknown rating list header: %s' % header.strip())
+            continue
+        start, label_end = span
+        columns.append((name, start, next((position for position in starts if position >= label_end), None)))
+    return columns
+
+
+def parse_txt(lines):
+    """
+    Parses the fixed width TXT rating list. Malformed records are returned as None.
+    :param lines: lines of the list, starting with the header
+    :type lines: Iterable
+    :rtype: Iterable
+    """
+    # Columns are sliced before decoding, as their widths are fixed in bytes.
+    lines = iter(lines)
+    columns = get_txt_columns(next(lines))
+    for line in lines:
+        if not line.strip():
+            continue
+        values = dict((name, decode(line[start:end])) for (name, start, end) in columns)
+        yield get_record(values['fide_id'], values.get('name', u''), values.get('country', u''), values['rating'],
+                         values.get('games', u''))
+
+
+def parse_xml(stream):
+    """
+    Parses the XML rating list, clearing every parsed player element so the memory used stays constant. Malformed
+    records are returned as None.
+    :param stream: file-like object
+    :rtype: Iterable
+    """
+    events = iter(cElementTree.iterparse(stream, events=('start', 'end')))
+    event, root = next(events)
+    for (event, element) in events:
+        if event == 'end' and element.tag == 'player':
+            yield get_record(element.findtext('fideid'), element.findtext('name') or u'',
+                             element.findtext('country') or u'', element.findtext('rating') or u'',
+                             element.findtext('games') or u'')
+            root.clear()
+
+
+def open_list(path):
+    """
+    Opens the rating list file, or the first file of the zip archive.
+    :returns: (file-like object, format) tuple
+    :rtype: tuple
+    """
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        name = archive.namelist()[0]
+        stream = archive.open(name)
+    else:
+        name = path
+        stream = open(path, 'rb')
+    return stream, Formats.XML if os.path.splitext(name)[1].lower() == '.xml' else Formats.TXT
+
+
+def parse(stream, list_format):
+    return parse_xml(stream) if list_format == Formats.XML else parse_txt(stream)
+
+
+class RatingListImport(object):
+    """
+    Imports the FIDE rating list in batches: players are matched by FIDE id through an in-memory index of the
+    existing ones, changed players are updated with a statement per set of changed columns, and the missing ones
+    are optionally created. Malformed records are skipped.
+    """
+    BATCH_SIZE = 1000
+    COLUMNS = ('rating', 'fide_games', 'country')
+
+    def __init__(self, create=False, batch_size=BATCH_SIZE, callback=None):
+        """
+        :param create: whether to create the players missing in the database
+        :type create: bool
+        :param batch_size: number of the list records imported at once
+        :type batch_size: int
+        :param callback: function called with (read, updated, created, skipped, seconds) counts after each batch
+        :type callback: callable
+        """
+        self.create = create
+        self.batch_size = batch_size
+        self.callback = callback
+
+    def run(self, records):
+        """
+        :param records: rating list records
+        :type records: Iterable
+        :returns: (read, updated, created, skipped) counts
+        :rtype: tuple
+        """
+        started = time.time()
+        index = self.get_index()
+        read = updated = created = skipped = 0
+        for batch in chunked(records, self.batch_size):
+            valid = filter(None, batch)
+            batch_updated, batch_created = self.import_batch(valid, index)
+            read, updated, created = read + len(batch), updated + batch_updated, created + batch_created
+            skipped += len(batch) - len(valid)
+            if self.callback is not None:
+                self.callback(read, updated, created, skipped, time.time() - started)
+        return read, updated, created, skipped
+
+    def get_index(self, **filters):
+        """
+        Returns index of the players having FIDE id.
+        :param filters: lookups selecting the players to index. If missing - all the players having FIDE id are
+        :returns: dict of { FIDE id: (player id, column values...) }
+        :rtype: dict
+        """
+        players = Player.objects.filter(fide_id__isnull=False, **filters).values_list('fide_id', 'id', *self.COLUMNS)
+        return dict((player[0], player[1:]) for player in players.iterator())
+
+    def import_batch(self, batch, index):
+        """
+        :returns: (updated, created) counts
+        :rtype: tuple
+        """
+        updates = defaultdict(list)
+        players = OrderedDict()
+        for record in batch:
+            values = dict(item for item in zip(self.COLUMNS, (record.rating, record.games,
+                                                              FEDERATIONS.get(record.country)))
+                          if item[1] is not None)
+            player = index.get(record.fide_id)
+            if player is None:
+                if self.create and 'rating' in values:
+                    # The latest record of a FIDE id repeated in the batch replaces the player queued for it.
+                    players[record.fide_id] = Player(fide_id=record.fide_id, name=record.name,
+                                                     country=values.pop('country', ''), **values)
+                continue
+
+            current = dict(zip(self.COLUMNS, player[1:]))
+            changed = tuple(column for column in self.COLUMNS
+                            if column in values and values[column] != current[column])
+            if changed:
+                updates[changed].append([values[column] for column in changed] + [player[0]])
+                current.update(values)
+                index[record.fide_id] = (player[0],) + tuple(current[column] for column in self.COLUMNS)
+
+        with transaction.commit_on_success():
+            for (columns, rows) in updates.iteritems():
+                update_columns(Player, columns, rows, self.batch_size)
+            Tournament.touch_players([row[-1] for rows in updates.itervalues() for row in rows])
+            Player.objects.bulk_create(players.values())
+        # Created players are indexed, so their records repeated in the following batches update them.
+        for fide_ids in chunked(players, 500):
+            index.update(self.get_index(fide_id__in=fide_ids))
+        return sum(len(rows) for rows in updates.itervalues()), len(players)
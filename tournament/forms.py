@@ -0,0 +1,135 @@
+# -*- encoding: utf-8 -*-
+from datetime import datetime
+
+from django import forms
+from django.db.models import Q
+
+from .models import Game
+
+
+class TournamentFilterForm(forms.Form):
+    """
+    Filters of the tournament list and its keyset pagination cursor.
+    The cursor is (start date, id) of the last tournament of the previous page, the list is ordered by both
+    descending, so any page is read from the index on them just like the first one.
+    """
+    FINISHED_CHOICES = (
+        ('', u'All'),
+        ('1', u'Finished'),
+        ('0', u'In progress')
+    )
+    CURSOR_DATE_FORMAT = '%Y-%m-%d'
+
+    finished = forms.ChoiceField(choices=FINISHED_CHOICES, required=False)
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'placeholder': u'Started from'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'placeholder': u'Started till'}))
+    before = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def clean_before(self):
+        before = self.cleaned_data.get('before')
+        if not before:
+            return None
+        try:
+            start_date, pk = before.split(',')
+            return datetime.strptime(start_date, self.CURSOR_DATE_FORMAT).date(), int(pk)
+        except ValueError:
+            raise forms.ValidationError(u'Invalid page cursor')
+
+    @classmethod
+    def get_cursor(cls, tournament):
+        return u'%s,%s' % (tournament.start_date.strftime(cls.CURSOR_DATE_FORMAT), tournament.pk)
+
+    def filter(self, queryset):
+        """
+        Applies the filters and the cursor to the tournaments queryset, the form must be valid.
+        :type queryset: QuerySet
+        :rtype: QuerySet
+        """
+        finished = self.cleaned_data.get('finished')
+        if finished:
+            queryset = queryset.filter(finished=finished == '1')
+        if self.cleaned_data.get('date_from') is not None:
+            queryset = queryset.filter(start_date__gte=self.cleaned_data['date_from'])
+        if self.cleaned_data.get('date_to') is not None:
+            queryset = queryset.filter(start_date__lte=self.cleaned_data['date_to'])
+        if self.cleaned_data.get('before') is not None:
+            start_date, pk = self.cleaned_data['before']
+            queryset = queryset.filter(Q(start_date__lt=start_date) | Q(start_date=start_date, pk__lt=pk))
+        return queryset
+
+
+class RoundResultsForm(forms.Form):
+    """
+    Results of all the games of the round, entered at once. Validated in memory against the games passed in, so
+    the whole round is checked before anything is written.
+    """
+    FIELD_PREFIX = 'game_'
+
+    finish_round = forms.BooleanField(required=False, label=u'Finish the round')
+
+    def __init__(self, games, *args, **kwargs):
+        """
+        :param games: games of the round
+        :type games: list
+        """
+        super(RoundResultsForm, self).__init__(*args, **kwargs)
+        self.games = games
+        for game in games:
+            self.fields[self.get_field_name(game.pk)] = forms.ChoiceField(
+                choices=Game.RESULT_CHOICES, label=unicode(game), initial=Game.get_result(game.finished, game.winner))
+
+    @classmethod
+    def get_field_name(cls, game_id):
+        return '%s%s' % (cls.FIELD_PREFIX, game_id)
+
+    @classmethod
+    def get_data(cls, games, payload):
+        """
+        Returns form data of the JSON payload { "results": { game id: result }, "finish_round": bool }. The games
+        missing in the payload keep their current results.
+        :type games: list
+        :type payload: dict
+        :rtype: dict
+        """
+        if not isinstance(payload, dict):
+            raise ValueError(u'Payload must be an object')
+        results = payload.get('results') or {}
+        if not isinstance(results, dict):
+            raise ValueError(u'Results must be an object of the game results by game id')
+        unknown = set(unicode(game_id) for game_id in results) - set(unicode(game.pk) for game in games)
+        if unknown:
+            raise ValueError(u'Unknown games: %s' % u', '.join(sorted(unknown)))
+
+        data = dict((cls.get_field_name(game.pk), results.get(unicode(game.pk), Game.get_result(game.finished,
+                                                                                                 game.winner)))
+                    for game in games)
+        if payload.get('finish_round'):
+            data['finish_round'] = 'on'
+        return data
+
+    def clean(self):
+        cleaned_data = super(RoundResultsForm, self).clean()
+        results = [cleaned_data.get(self.get_field_name(game.pk)) for game in self.games]
+        if cleaned_data.get('finish_round') and None not in results and '*' in results:
+            raise forms.ValidationError(u'The round can not be finished while some games are not finished')
+        return cleaned_data
+
+    def get_game_fields(self):
+        """
+        Returns (game, bound field) pairs in the games order.
+        :rtype: list
+        """
+        return [(game, self[self.get_field_name(game.pk)]) for game in self.games]
+
+    def get_changes(self):
+        """
+        Returns results of the changed games, the form must be valid.
+        :returns: dict of { game id: (finished, winner) }
+        :rtype: dict
+        """
+        changes = {}
+        for game in self.games:
+            finished, winner = Game.parse_result(self.cleaned_data[self.get_field_name(game.pk)])
+            if (finished, winner) != (game.finished, (game.winner or None) if game.finished else None):
+                changes[game.pk] = (finished, winner)
+        return changes
@@ -0,0 +1,176 @@
+# -*- encoding: utf-8 -*-
+"""
+Database backed queue of the round progressions, run in the background so the admin requests never wait for them.
+Jobs are run either by a worker thread of the process they were submitted in, or by `manage.py progression_worker`,
+depending on TOURNAMENT_PROGRESSION_WORKER setting. A job is claimed by a conditional update of its status, so any
+number of workers can share the queue.
+"""
+from datetime import timedelta
+import logging
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import JobStatuses, ProgressionJob, Tournament
+
+logger = logging.getLogger(__name__)
+
+
+class Workers(object):
+    THREAD = 'thread'
+    COMMAND = 'command'
+
+
+WORKER = getattr(settings, 'TOURNAMENT_PROGRESSION_WORKER', Workers.THREAD)
+# Jobs running longer are considered lost with their worker, so the tournament can be progressed again.
+JOB_TIMEOUT = getattr(settings, 'TOURNAMENT_PROGRESSION_JOB_TIMEOUT', 60 * 60)
+
+
+def submit(tournament):
+    """
+    Queues progression of the tournament. Submissions for the tournament having an active job already are coalesced
+    into it.
+    :type tournament: Tournament
+    :returns: the new job, or the active one
+    :rtype: ProgressionJob
+    """
+    fail_stale()
+    job = None
+    for attempt in xrange(2):
+        try:
+            with transaction.commit_on_success():
+                job = ProgressionJob.objects.create(tournament=tournament, lock=tournament.pk,
+                                                    rounds_count=tournament.round_set.count())
+            logger.info(u'Progression of "%s" queued', tournament)
+            break
+        except IntegrityError:
+            job = next(iter(ProgressionJob.objects.filter(lock=tournament.pk)), None)
+            # None if the active job has just finished, so a new one can be queued.
+            if job is not None:
+                break
+    if job is None:
+        raise UserWarning(u'Progression of "%s" could not be queued' % tournament)
+
+    # Coalesced jobs wake the worker too, in case the process their worker ran in is gone.
+    if WORKER == Workers.THREAD and job.status == JobStatuses.QUEUED:
+        WorkerThread.wake()
+    return job
+
+
+def get_latest_job(tournament):
+    """
+    :type tournament: Tournament
+    :rtype: ProgressionJob
+    """
+    return next(iter(ProgressionJob.objects.filter(tournament=tournament).order_by('-created', '-id')[:1]), None)
+
+
+def fail_stale():
+    """
+    Fails the jobs running longer than JOB_TIMEOUT.
+    """
+    stale = ProgressionJob.objects.filter(status=JobStatuses.RUNNING,
+                                          started__lt=timezone.now() - timedelta(seconds=JOB_TIMEOUT))
+    stale.update(status=JobStatuses.FAILED, lock=None, finished=timezone.now(),
+                 message=u'The job was not finished in %d seconds' % JOB_TIMEOUT)
+
+
+def claim_next():
+    """
+    Marks the oldest queued job as running.
+    :returns: the claimed job, None if the queue is empty
+    :rtype: ProgressionJob
+    """
+    for job_id in ProgressionJob.objects.filter(status=JobStatuses.QUEUED).order_by('created', 'id') \
+            .values_list('id', flat=True)[:10]:
+        claimed = ProgressionJob.objects.filter(pk=job_id, status=JobStatuses.QUEUED) \
+            .update(status=JobStatuses.RUNNING, started=timezone.now())
+        if claimed:
+            return ProgressionJob.objects.select_related('tournament').get(pk=job_id)
+    return None
+
+
+def run(job):
+    """
+    Progresses the tournament of the claimed job and records the outcome, unless the job was failed as stale
+    meanwhile.
+    :type job: ProgressionJob
+    """
+    try:
+        # A stale job may still be running: the rounds were counted when each job was submitted, so whichever of
+        # them starts the round first makes the other one fail instead of starting it again.
+        job.round = Tournament.objects.get(pk=job.tournament_id).progress(rounds_count=job.rounds_count)
+        job.status = JobStatuses.DONE
+    except UserWarning, e:
+        job.status, job.message = JobStatuses.FAILED, unicode(e)
+    except Exception, e:
+        logger.exception(u'Progression of "%s" failed', job.tournament)
+        job.status, job.message = JobStatuses.FAILED, u'Unexpected error: %r' % e
+    job.lock = None
+    job.finished = timezone.now()
+    finished = ProgressionJob.objects.filter(pk=job.pk, status=JobStatuses.RUNNING).update(
+        status=job.status, message=job.message, round=job.round, lock=None, finished=job.finished)
+    if not finished:
+        logger.warning(u'Progression of "%s" %s after its job was failed as stale', job.tournament, job.status)
+        return
+    logger.info(u'Progression of "%s" %s in %.3fs', job.tournament, job.status,
+                (job.finished - job.started).total_seconds())
+
+
+def run_pending():
+    """
+    Runs the queued jobs until the queue is empty.
+    :returns: number of the jobs run
+    :rtype: int
+    """
+    # The connection is not in autocommit mode: the read transaction of the previous poll is ended, so this one sees
+    # the jobs submitted since.
+    transaction.commit_unless_managed()
+    count = 0
+    fail_stale()
+    job = claim_next()
+    while job is not None:
+        run(job)
+        count += 1
+        job = claim_next()
+    return count
+
+
+class WorkerThread(threading.Thread):
+    """
+    Daemon thread running the queued jobs. At most one runs in a process, started when a job is submitted and
+    stopped once the queue is empty.
+    """
+    lock = threading.Lock()
+    current = None
+    pending = False
+
+    def __init__(self):
+        super(WorkerThread, self).__init__(name='progression-worker')
+        self.daemon = True
+
+    @classmethod
+    def wake(cls):
+        with cls.lock:
+            cls.pending = True
+            if cls.current is None:
+                cls.current = cls()
+                cls.current.start()
+
+    def run(self):
+        try:
+            while True:
+                with self.lock:
+                    if not WorkerThread.pending:
+                        WorkerThread.current = None
+                        return
+                    WorkerThread.pending = False
+                try:
+                    run_pending()
+                except Exception:
+                    logger.exception(u'Progression worker failed')
+        finally:
+            # Database connections are per thread, this one is never reused.
+            connection.close()
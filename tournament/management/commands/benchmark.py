@@ -0,0 +1,78 @@
+# -*- encoding: utf-8 -*-
+from datetime import datetime
+import json
+from optparse import make_option
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ...benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    args = '<benchmark benchmark ...>'
+    help = 'Runs the tournament benchmarks: %s. Runs all of them if none is given.' % ', '.join(BENCHMARKS)
+    option_list = BaseCommand.option_list + (
+        make_option('--players', default='16,128,1024',
+                    help='Comma separated list of tournament sizes to run the pairing benchmarks with.'),
+        make_option('--games', default='1000,100000',
+                    help='Comma separated list of games numbers to run the rating benchmarks with.'),
+        make_option('--tournament-players', dest='tournament_players', default='16,128,1024,8192',
+                    help='Comma separated list of tournament sizes to run the database benchmarks with.'),
+        make_option('--seed', type='int', default=0,
+                    help='Seed of the random numbers generator.'),
+        make_option('--database', default=os.path.join(tempfile.gettempdir(), 'chess_benchmark.db'),
+                    help='SQLite database file created for the database benchmarks and removed afterwards.'),
+        make_option('--output', default=None,
+                    help='JSON file to save the results to, for comparing them between commits.'),
+        make_option('--label', default='',
+                    help='Label of the run saved along with the results, like the commit benchmarked.'),
+    )
+
+    def handle(self, *args, **options):
+        for name in args:
+            if name not in BENCHMARKS:
+                raise CommandError('Unknown benchmark "%s"' % name)
+
+        names = args or BENCHMARKS.keys()
+        results = []
+        for name in names:
+            benchmark, sizes_option, uses_database = BENCHMARKS[name]
+            sizes = [int(size) for size in options[sizes_option].split(',')]
+            if uses_database:
+                benchmark_results = self.run_on_database(benchmark, sizes, options)
+            else:
+                benchmark_results = benchmark(sizes, seed=options['seed'])
+            for result in benchmark_results:
+                self.stdout.write(u'  '.join(u'%s=%s' % (key, self.format_value(value))
+                                             for (key, value) in result.iteritems()))
+            results.extend(benchmark_results)
+
+        if options['output'] is not None:
+            with open(options['output'], 'wb') as output:
+                json.dump({
+                    'label': options['label'],
+                    'created': datetime.now().isoformat(),
+                    'seed': options['seed'],
+                    'results': results
+                }, output, indent=2)
+
+    def run_on_database(self, benchmark, sizes, options):
+        """
+        Runs the benchmark on a freshly created SQLite database, so the benchmark data never gets into the project one.
+        """
+        if connection.vendor != 'sqlite':
+            raise CommandError('Database benchmarks run on SQLite only')
+
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict['TEST_NAME'] = options['database']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            return benchmark(sizes, seed=options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def format_value(self, value):
+        return '%.6f' % value if isinstance(value, float) else value
@@ -0,0 +1,51 @@
+# -*- encoding: utf-8 -*-
+from optparse import make_option
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...exports import EXPORTERS, Formats, export
+from ...forms import TournamentFilterForm
+from ...models import Tournament
+
+
+class Command(BaseCommand):
+    help = 'Exports games of a tournament or of the tournaments started in a date range as %s.' % \
+           ', '.join(sorted(EXPORTERS)).upper()
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='export_format', default=Formats.PGN,
+                    help='Export format: %s.' % ', '.join(sorted(EXPORTERS))),
+        make_option('--tournament', type='int', default=None,
+                    help='Id of the tournament to export.'),
+        make_option('--from', dest='date_from', default=None,
+                    help='Export tournaments started on or after the date (YYYY-MM-DD).'),
+        make_option('--to', dest='date_to', default=None,
+                    help='Export tournaments started on or before the date (YYYY-MM-DD).'),
+        make_option('--finished', action='store_true', default=False,
+                    help='Export finished tournaments only.'),
+        make_option('--output', default=None,
+                    help='File to write the export to. Standard output is used if missing.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['export_format'] not in EXPORTERS:
+            raise CommandError('Unknown format "%s"' % options['export_format'])
+
+        tournaments = Tournament.objects.all()
+        if options['tournament'] is not None:
+            tournaments = tournaments.filter(pk=options['tournament'])
+        form = TournamentFilterForm({'date_from': options['date_from'], 'date_to': options['date_to'],
+                                     'finished': '1' if options['finished'] else ''})
+        if not form.is_valid():
+            raise CommandError(u'; '.join(u'%s: %s' % (field, u' '.join(errors))
+                                          for (field, errors) in form.errors.iteritems()))
+        tournaments = form.filter(tournaments)
+
+        chunks, content_type = export(tournaments, options['export_format'])
+        output = open(options['output'], 'wb') if options['output'] is not None else sys.stdout
+        try:
+            for chunk in chunks:
+                output.write(chunk.encode('utf-8'))
+        finally:
+            if output is not sys.stdout:
+                output.close()
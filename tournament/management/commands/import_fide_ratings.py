@@ -0,0 +1,52 @@
+# -*- encoding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...fide import Formats, RatingListImport, open_list, parse
+
+
+class Command(BaseCommand):
+    args = '<rating list file>'
+    help = 'Imports ratings, games and federations of the players from the FIDE rating list (TXT or XML, ' \
+           'optionally zipped), matching the players by FIDE id.'
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='list_format', default=None,
+                    help='Rating list format: %s. Detected by the file extension if missing.' %
+                         ', '.join((Formats.TXT, Formats.XML))),
+        make_option('--create', action='store_true', default=False,
+                    help='Create the rated players missing in the database.'),
+        make_option('--batch-size', type='int', default=RatingListImport.BATCH_SIZE,
+                    help='Number of the rating list records imported at once.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Rating list file is required')
+        if options['list_format'] not in (None, Formats.TXT, Formats.XML):
+            raise CommandError('Unknown format "%s"' % options['list_format'])
+
+        self.verbosity = int(options['verbosity'])
+        self.batch_size = options['batch_size']
+        try:
+            stream, list_format = open_list(args[0])
+        except IOError, e:
+            raise CommandError(e)
+
+        rating_list_import = RatingListImport(create=options['create'], batch_size=self.batch_size,
+                                              callback=self.report_progress)
+        try:
+            read, updated, created, skipped = rating_list_import.run(parse(stream,
+                                                                          options['list_format'] or list_format))
+        except (UserWarning, ValueError, SyntaxError), e:
+            raise CommandError(e)
+        finally:
+            stream.close()
+
+        self.stdout.write('Read %d players: %d updated, %d created, %d malformed skipped' %
+                          (read, updated, created, skipped))
+
+    def report_progress(self, read, updated, created, skipped, seconds):
+        if self.verbosity > 1 or read % (self.batch_size * 100) == 0:
+            self.stdout.write('Read %d players: %d updated, %d created, %d malformed skipped, %.0f players/s' %
+                              (read, updated, created, skipped, read / seconds if seconds else 0.0))
@@ -0,0 +1,33 @@
+# -*- encoding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...profiling import get_sample_rate, set_sample_rate
+
+
+class Command(BaseCommand):
+    args = '<on|off|reset|status>'
+    help = 'Turns profiling of the requests by ProfilingMiddleware on or off for all the processes sharing the ' \
+           'database, resets it to the TOURNAMENT_PROFILING_SAMPLE_RATE setting or shows its state.'
+    option_list = BaseCommand.option_list + (
+        make_option('--sample-rate', dest='sample_rate', type='float', default=1.0,
+                    help='Share of the requests to profile when turned on, from 0 to 1.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1 or args[0] not in ('on', 'off', 'reset', 'status'):
+            raise CommandError('Usage: profiling %s' % self.args)
+        if not 0 < options['sample_rate'] <= 1:
+            raise CommandError('Sample rate must be greater than 0 and at most 1')
+
+        action = args[0]
+        if action == 'on':
+            set_sample_rate(options['sample_rate'])
+        elif action == 'off':
+            set_sample_rate(0.0)
+        elif action == 'reset':
+            set_sample_rate(None)
+
+        rate = get_sample_rate()
+        self.stdout.write('Profiling is %s' % ('on, sample rate %g' % rate if rate > 0 else 'off'))
@@ -0,0 +1,28 @@
+# -*- encoding: utf-8 -*-
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = 'Runs the queued round progressions, polling the queue until interrupted. ' \
+           'Required with TOURNAMENT_PROGRESSION_WORKER = "command".'
+    option_list = BaseCommand.option_list + (
+        make_option('--once', action='store_true', default=False,
+                    help='Run the queued jobs and exit.'),
+        make_option('--interval', type='float', default=2.0,
+                    help='Seconds to wait between the polls of the empty queue.'),
+    )
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_pending()
+            if count and int(options['verbosity']) > 0:
+                self.stdout.write('%d progressions run' % count)
+            if options['once']:
+                return
+            if not count:
+                time.sleep(options['interval'])
@@ -0,0 +1,38 @@
+# -*- encoding: utf-8 -*-
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...replay import RatingReplay
+
+
+class Command(BaseCommand):
+    help = 'Recomputes rating deltas of all finished tournaments in chronological order and updates player ratings.'
+    option_list = BaseCommand.option_list + (
+        make_option('--since', type='int', default=None,
+                    help='Id of the earliest tournament affected by the changes. '
+                         'The replay starts from the last checkpoint made before it.'),
+        make_option('--resume', action='store_true', default=False,
+                    help='Resume the replay from the latest checkpoint.'),
+        make_option('--checkpoint-interval', type='int', default=100,
+                    help='Number of tournaments replayed between checkpoints.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['since'] is not None and options['resume']:
+            raise CommandError('--since and --resume are mutually exclusive')
+
+        self.verbosity = int(options['verbosity'])
+        started = time.time()
+        replay = RatingReplay(checkpoint_interval=options['checkpoint_interval'], callback=self.report_progress)
+        try:
+            replayed = replay.run(since=options['since'], resume=options['resume'])
+        except UserWarning, e:
+            raise CommandError(e)
+
+        self.stdout.write('Replayed %d tournaments in %.1fs' % (replayed, time.time() - started))
+
+    def report_progress(self, tournament_id, replayed, total):
+        if self.verbosity > 1 or replayed == total or replayed % 100 == 0:
+            self.stdout.write('Tournament #%s replayed (%d / %d)' % (tournament_id, replayed, total))
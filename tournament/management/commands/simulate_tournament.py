@@ -0,0 +1,55 @@
+# -*- encoding: utf-8 -*-
+from collections import OrderedDict
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Pairings, Tournament
+from ...simulation import TournamentSimulation
+
+
+class Command(BaseCommand):
+    help = 'Creates a synthetic tournament and plays it out with results drawn from the Elo expectations, ' \
+           'reporting wall time, queries and peak memory of every phase.'
+    option_list = BaseCommand.option_list + (
+        make_option('--players', type='int', default=1000,
+                    help='Number of the players to create.'),
+        make_option('--rounds', type='int', default=None,
+                    help='Number of the rounds to play. The tournament is played until it is finished if missing.'),
+        make_option('--pairing', default=Pairings.GREEDY,
+                    help='Pairing engine of the tournament: %s.' % ', '.join(
+                        choice for (choice, name) in Tournament.PAIRING_CHOICES)),
+        make_option('--draw-rate', dest='draw_rate', type='float', default=0.3,
+                    help='Probability of a draw between equally rated players.'),
+        make_option('--seed', type='int', default=0,
+                    help='Seed of the random numbers generator.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['pairing'] not in dict(Tournament.PAIRING_CHOICES):
+            raise CommandError('Unknown pairing "%s"' % options['pairing'])
+        if options['players'] < 2:
+            raise CommandError('At least two players are required')
+
+        self.totals = OrderedDict()
+        simulation = TournamentSimulation(options['players'], seed=options['seed'], pairing=options['pairing'],
+                                          rounds=options['rounds'], draw_rate=options['draw_rate'],
+                                          callback=self.report)
+        try:
+            tournament = simulation.run()
+        except UserWarning, e:
+            raise CommandError(e)
+
+        for (name, (count, seconds, queries)) in self.totals.iteritems():
+            self.stdout.write(u'total  phase=%s  count=%d  seconds=%.6f  queries=%d' % (name, count, seconds, queries))
+        self.stdout.write(u'tournament=%d  rounds=%d  finished=%s' % (tournament.pk, tournament.round_set.count(),
+                                                                      tournament.finished))
+
+    def report(self, phase):
+        count, seconds, queries = self.totals.get(phase.name, (0, 0.0, 0))
+        self.totals[phase.name] = (count + 1, seconds + phase.seconds, queries + phase.queries)
+        self.stdout.write(u'  '.join(u'%s=%s' % (key, self.format_value(value))
+                                     for (key, value) in phase.as_dict().iteritems()))
+
+    def format_value(self, value):
+        return '%.6f' % value if isinstance(value, float) else value
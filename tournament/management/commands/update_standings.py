@@ -0,0 +1,27 @@
+# -*- encoding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Tournament
+
+
+class Command(BaseCommand):
+    args = '[tournament id ...]'
+    help = 'Rebuilds standings of the given tournaments, or builds them for the tournaments having players but no ' \
+           'standings yet, like the ones played before the standings table existed.'
+
+    def handle(self, *args, **options):
+        try:
+            tournament_ids = [int(arg) for arg in args]
+        except ValueError:
+            raise CommandError('Tournament ids must be integers')
+
+        if tournament_ids:
+            tournaments = Tournament.objects.filter(pk__in=tournament_ids)
+        else:
+            tournaments = Tournament.objects.filter(players__isnull=False, standing__isnull=True).distinct()
+
+        count = 0
+        for tournament in tournaments.order_by('id').iterator():
+            tournament.update_standings()
+            count += 1
+        self.stdout.write('Standings of %d tournaments updated' % count)
@@ -0,0 +1,33 @@
+# -*- encoding: utf-8 -*-
+import random
+
+from .profiling import REQUEST_LOG, RequestProfile, get_sample_rate, instrument_templates
+
+
+class ProfilingMiddleware(object):
+    """
+    Opt-in profiling of a sample of the requests: total and template render time, number and time of the SQL queries,
+    the duplicated statements and the slowest ones. Works with DEBUG off, queries are only recorded for the sampled
+    requests. Profiles are kept in the in-process REQUEST_LOG ring buffer, shown by the profiling view.
+    The sample rate is set with `manage.py profiling`. Place the middleware first to include the time spent in the
+    others. Queries of the streamed content are executed after the response is returned, so they are not included.
+    """
+
+    def __init__(self):
+        instrument_templates()
+
+    def process_request(self, request):
+        rate = get_sample_rate()
+        if rate > 0 and (rate >= 1 or random.random() < rate):
+            request.request_profile = RequestProfile(request)
+            request.request_profile.__enter__()
+
+    def process_response(self, request, response):
+        profile = getattr(request, 'request_profile', None)
+        if profile is not None:
+            resolver_match = getattr(request, 'resolver_match', None)
+            profile.view = resolver_match.view_name if resolver_match is not None else None
+            profile.status = response.status_code
+            profile.__exit__(None, None, None)
+            REQUEST_LOG.add(profile)
+        return response
@@ -1,9 +1,13 @@
 # -*- encoding: utf-8 -*-
+import json
+
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 import django_countries
 
+from .cache import invalidate_list
+
 
 class Side(object):
     WHITE = 'white'
@@ -16,6 +20,18 @@ class Scores(object):
     DEFEAT = 0.0
 
 
+class Pairings(object):
+    GREEDY = 'greedy'
+    MATCHING = 'matching'
+
+
+class JobStatuses(object):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
 class RefereeProfile(models.Model):
     user = models.OneToOneField(User)
 
@@ -38,7 +54,7 @@ class Player(models.Model):
     name = models.CharField(max_length=128)
     country = django_countries.CountryField()
     rating = models.IntegerField()
-    fide_id = models.IntegerField(blank=True, null=True, default=None)
+    fide_id = models.IntegerField(blank=True, null=True, default=None, db_index=True)
     fide_games = models.IntegerField(blank=True, null=True, default=None)
 
     def is_fide_newbie(self):
@@ -50,16 +66,74 @@ class Player(models.Model):
         return u'%s [%s]' % (self.name, self.rating)
 
 
-from tournament import SwissSystemMixin
+from tournament import SwissSystemMixin, chunked
 
 
 class Tournament(models.Model, SwissSystemMixin):
+    PAIRING_CHOICES = (
+        (Pairings.GREEDY, 'Greedy'),
+        (Pairings.MATCHING, 'Maximum weight matching')
+    )
     name = models.CharField(max_length=128)
     players = models.ManyToManyField(Player)
     referee = models.ForeignKey(RefereeProfile)
     start_date = models.DateField()
     end_date = models.DateField(blank=True, null=True)
     finished = models.BooleanField()
+    pairing = models.CharField(max_length=8, choices=PAIRING_CHOICES, default=Pairings.GREEDY)
+    version = models.PositiveIntegerField(default=0, editable=False,
+                                          help_text=u'Incremented on every change of the tournament or its results')
+
+    class Meta:
+        index_together = (('start_date', 'id'), ('finished', 'start_date', 'id'))
+
+    def save(self, *args, **kwargs):
+        # Version is only incremented in the database, so it is never overwritten with a stale value.
+        if self.pk is not None and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.local_fields
+                                       if not field.primary_key and field.name != 'version']
+        super(Tournament, self).save(*args, **kwargs)
+
+    def touch(self):
+        """
+        Increments version of the tournament, invalidating its cached pages.
+        """
+        Tournament.objects.filter(pk=self.pk).update(version=models.F('version') + 1)
+
+    @staticmethod
+    def related_post_change(sender, instance, raw=False, **kwargs):
+        if raw:
+            return
+        if sender is Tournament:
+            tournaments = Tournament.objects.filter(pk=instance.pk)
+            invalidate_list()
+        elif sender is Round:
+            tournaments = Tournament.objects.filter(pk=instance.tournament_id)
+        elif sender is Game:
+            tournaments = Tournament.objects.filter(round=instance.round_id)
+        else:
+            tournaments = Tournament.objects.filter(round__game=instance.game_id)
+        tournaments.update(version=models.F('version') + 1)
+
+    @staticmethod
+    def players_changed(sender, action, **kwargs):
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_list()
+
+    @staticmethod
+    def player_changed(sender, instance, raw=False, **kwargs):
+        if not raw:
+            Tournament.touch_players([instance.pk])
+
+    @staticmethod
+    def touch_players(player_ids, batch_size=500):
+        """
+        Increments version of the tournaments the players play in, as their pages show the players names and ratings.
+        :param player_ids: ids of the changed players
+        :type player_ids: Iterable
+        """
+        for batch in chunked(player_ids, batch_size):
+            Tournament.objects.filter(players__in=batch).update(version=models.F('version') + 1)
 
     def players_count(self):
         return self.players.count()
@@ -83,9 +157,6 @@ class Tournament(models.Model, SwissSystemMixin):
         except IndexError:
             return None
 
-    def get_player_scores(self, player):
-        return player.score_set.filter(game__in=self.get_games().all())
-
     def __unicode__(self):
         return self.name
 
@@ -129,6 +200,39 @@ class Game(EloRatingMixin, models.Model):
     start_date = models.DateTimeField()
     end_date = models.DateTimeField(blank=True, null=True)
 
+    RESULT_CHOICES = (
+        ('*', u'Not finished'),
+        ('1-0', u'White won'),
+        ('0-1', u'Black won'),
+        ('1/2-1/2', u'Draw')
+    )
+
+    @staticmethod
+    def get_result(finished, winner):
+        """
+        Returns result of the game in the PGN notation.
+        """
+        if not finished:
+            return '*'
+        elif winner == Side.WHITE:
+            return '1-0'
+        elif winner == Side.BLACK:
+            return '0-1'
+        else:
+            return '1/2-1/2'
+
+    @staticmethod
+    def parse_result(result):
+        """
+        Returns (finished, winner) of the game result in the PGN notation.
+        :rtype: tuple
+        """
+        results = {'*': (False, None), '1-0': (True, Side.WHITE), '0-1': (True, Side.BLACK),
+                   '1/2-1/2': (True, None)}
+        if result not in results:
+            raise ValueError(u'Unknown game result: %s' % result)
+        return results[result]
+
     def __unicode__(self):
         return u'%s vs. %s' % (self.white, self.black)
 
@@ -146,3 +250,222 @@ class Score(models.Model):
 
     def __unicode__(self):
         return u'%s: %.1f (%+1.1f)' % (self.player, self.score, self.rating_delta)
+
+
+class Standing(models.Model):
+    """
+    Denormalized tournament standings of the player, maintained from the scores of the tournament.
+    """
+    tournament = models.ForeignKey(Tournament)
+    player = models.ForeignKey(Player)
+    points = models.FloatField(default=0.0)
+    games_played = models.IntegerField(default=0)
+    whites = models.IntegerField(default=0)
+    blacks = models.IntegerField(default=0)
+    rating_delta = models.FloatField(default=0.0)
+    rank = models.IntegerField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ('tournament', 'player')
+        index_together = (('tournament', 'rank'),)
+
+    def color_balance(self):
+        return self.whites - self.blacks
+
+    @staticmethod
+    def game_post_save(sender, instance, raw=False, **kwargs):
+        if not raw:
+            instance.update_scores()
+
+    @staticmethod
+    def game_post_delete(sender, instance, **kwargs):
+        # Scores of the game are deleted along with it. Its round is missing if that is deleted too, which rebuilds
+        # the standings once for all its games.
+        for tournament in Tournament.objects.filter(round=instance.round_id):
+            tournament.update_standings([instance.white_id, instance.black_id])
+
+    @staticmethod
+    def round_post_delete(sender, instance, **kwargs):
+        # The tournament is missing if that is deleted too, along with its standings.
+        for tournament in Tournament.objects.filter(pk=instance.tournament_id):
+            tournament.update_standings()
+
+    @staticmethod
+    def score_post_save(sender, instance, raw=False, **kwargs):
+        if not raw:
+            Tournament.objects.get(round__game=instance.game_id).update_standings([instance.player_id], rank=False)
+
+    @staticmethod
+    def tournament_players_changed(sender, instance, action, reverse, pk_set, **kwargs):
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+        if not reverse:
+            tournaments = [instance]
+        elif pk_set is not None:
+            tournaments = Tournament.objects.filter(pk__in=pk_set)
+        else:
+            tournaments = Tournament.objects.filter(standing__player=instance).distinct()
+        for tournament in tournaments:
+            tournament.update_standings()
+
+    def __unicode__(self):
+        return u'%s. %s: %.1f' % (self.rank, self.player, self.points)
+
+
+# Scores are only deleted in bulk by the scoring stages, which increment the version themselves: a delete receiver
+# would turn their single DELETE statements into a signal per row.
+for model in (Tournament, Round, Game, Score):
+    post_save.connect(Tournament.related_post_change, sender=model)
+for model in (Tournament, Round, Game):
+    post_delete.connect(Tournament.related_post_change, sender=model)
+m2m_changed.connect(Tournament.players_changed, sender=Tournament.players.through)
+# Tournaments of a deleted player are found before its memberships are deleted along with it.
+post_save.connect(Tournament.player_changed, sender=Player)
+pre_delete.connect(Tournament.player_changed, sender=Player)
+
+post_save.connect(Standing.game_post_save, sender=Game)
+post_delete.connect(Standing.game_post_delete, sender=Game)
+post_delete.connect(Standing.round_post_delete, sender=Round)
+post_save.connect(Standing.score_post_save, sender=Score)
+m2m_changed.connect(Standing.tournament_players_changed, sender=Tournament.players.through)
+
+
+class RatingChange(models.Model):
+    tournament = models.ForeignKey(Tournament)
+    player = models.ForeignKey(Player)
+    rating_before = models.IntegerField()
+    rating_after = models.IntegerField()
+
+    class Meta:
+        unique_together = ('tournament', 'player')
+
+    def rating_delta(self):
+        return self.rating_after - self.rating_before
+
+    def __unicode__(self):
+        return u'%s: %s -> %s' % (self.player, self.rating_before, self.rating_after)
+
+
+class RatingSnapshot(models.Model):
+    player = models.ForeignKey(Player)
+    tournament = models.ForeignKey(Tournament)
+    round = models.ForeignKey(Round, blank=True, null=True, help_text=u'Missing for the final tournament rating')
+    date = models.DateTimeField(db_index=True)
+    rating = models.IntegerField()
+
+    class Meta:
+        unique_together = ('tournament', 'round', 'player')
+        index_together = (('player', 'date'),)
+
+    @staticmethod
+    def get_rating(player, date):
+        """
+        Returns rating of the player at the given moment, None if there is no snapshot before it.
+        """
+        snapshots = RatingSnapshot.objects.filter(player=player, date__lte=date).order_by('-date')
+        return next(iter(snapshots.values_list('rating', flat=True)[:1]), None)
+
+    def __unicode__(self):
+        return u'%s: %s (%s)' % (self.player, self.rating, self.round or self.tournament)
+
+
+class RatingCheckpoint(models.Model):
+    tournament = models.ForeignKey(Tournament, help_text=u'The last tournament replayed before the checkpoint')
+    created = models.DateTimeField(auto_now_add=True)
+    ratings = models.TextField(help_text=u'JSON object of the rating changes of the replayed tournaments so far, '
+                                         u'by player id')
+
+    def get_deltas(self):
+        return dict((int(player_id), delta) for (player_id, delta) in json.loads(self.ratings).iteritems())
+
+    def set_deltas(self, deltas):
+        self.ratings = json.dumps(deltas, separators=(',', ':'))
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.created, self.tournament)
+
+
+class ProgressionLog(models.Model):
+    """
+    Cost of a single progress() of the tournament, in total and by the phases it was spent in.
+    """
+    tournament = models.ForeignKey(Tournament)
+    round = models.ForeignKey(Round, blank=True, null=True, help_text=u'Missing when the tournament was finished')
+    created = models.DateTimeField(auto_now_add=True)
+    players = models.IntegerField(default=0)
+    games = models.IntegerField(default=0)
+    byes = models.IntegerField(default=0)
+    floaters = models.IntegerField(default=0, help_text=u'Players paired outside of their score group')
+    seconds = models.FloatField()
+    queries = models.IntegerField()
+    query_seconds = models.FloatField()
+    phases = models.TextField(help_text=u'JSON list of [name, depth, seconds, queries, query seconds] of the phases')
+
+    class Meta:
+        index_together = (('tournament', 'created'),)
+
+    def get_phases(self):
+        return json.loads(self.phases)
+
+    def set_phases(self, phases):
+        self.phases = json.dumps(phases, separators=(',', ':'))
+
+    def __unicode__(self):
+        return u'%s: %s (%.3fs)' % (self.created, self.round or self.tournament, self.seconds)
+
+
+class ProfilingSwitch(models.Model):
+    """
+    Sample rate of the request profiling set by `manage.py profiling`, shared by all the processes through this
+    single row.
+    """
+    ID = 1
+
+    sample_rate = models.FloatField(help_text=u'Share of the requests to profile, from 0 to 1')
+    updated = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return u'%g' % self.sample_rate
+
+
+class ProgressionJob(models.Model):
+    """
+    Round progression of the tournament submitted to run in the background, see jobs module.
+    """
+    STATUS_CHOICES = (
+        (JobStatuses.QUEUED, 'Queued'),
+        (JobStatuses.RUNNING, 'Running'),
+        (JobStatuses.DONE, 'Done'),
+        (JobStatuses.FAILED, 'Failed')
+    )
+    tournament = models.ForeignKey(Tournament)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=JobStatuses.QUEUED)
+    lock = models.IntegerField(blank=True, null=True, unique=True, editable=False,
+                               help_text=u'Tournament id while the job is active, so a tournament has one at most')
+    round = models.ForeignKey(Round, blank=True, null=True, on_delete=models.SET_NULL,
+                              help_text=u'The started round, missing if the tournament was finished')
+    rounds_count = models.IntegerField(blank=True, null=True, editable=False,
+                                       help_text=u'Number of the rounds the tournament had when the job was submitted')
+    message = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        index_together = (('status', 'created'), ('tournament', 'created'))
+
+    def as_dict(self):
+        return {
+            'id': self.pk,
+            'tournament': self.tournament_id,
+            'status': self.status,
+            'status_display': self.get_status_display(),
+            'message': self.message,
+            'round': self.round_id,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.tournament, self.get_status_display())
@@ -0,0 +1,419 @@
+# -*- encoding: utf-8 -*-
+from array import array
+import itertools
+import random
+
+from .matching import max_weight_matching
+
+
+class PlayedPairs(object):
+    """
+    Index of the pairs of players already played in the tournament, keyed by player ids. Bye is represented by None.
+    Each pair is packed into a single integer, independent of the players order.
+    """
+    __slots__ = ('keys',)
+
+    def __init__(self, pairs=()):
+        """
+        :param pairs: (white id, black id) pairs
+        :type pairs: Iterable
+        """
+        self.keys = set(itertools.starmap(self.get_key, pairs))
+
+    @staticmethod
+    def get_key(player, opponent):
+        player, opponent = player or 0, opponent or 0
+        return player << 32 | opponent if player < opponent else opponent << 32 | player
+
+    def __contains__(self, pair):
+        return self.get_key(*pair) in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, player, opponent):
+        self.keys.add(self.get_key(player, opponent))
+
+
+class Colors(object):
+    WHITE = 1
+    BLACK = -1
+    NONE = 0
+
+
+class Preferences(object):
+    NONE = 0
+    MILD = 1
+    STRONG = 2
+    ABSOLUTE = 3
+
+
+class TournamentState(object):
+    """
+    Compact, database independent tournament state the pairing engine works on.
+    Players are addressed by their indexes in the state arrays.
+    Color history of every player is kept as number of games by white and black, the last color and its streak.
+    """
+    __slots__ = ('ids', 'scores', 'ratings', 'whites', 'blacks', 'last_colors', 'streaks', 'played', 'indexes')
+
+    def __init__(self, ids, scores, ratings, played=()):
+        """
+        :param ids: player ids
+        :type ids: Iterable
+        :param scores: current tournament scores, in the same order as ids
+        :type scores: Iterable
+        :param ratings: player ratings, in the same order as ids
+        :type ratings: Iterable
+        :param played: pairs already played in the tournament
+        :type played: PlayedPairs
+        """
+        self.ids = array('l', ids)
+        self.scores = array('d', scores)
+        self.ratings = array('l', ratings)
+        self.whites = array('l', itertools.repeat(0, len(self.ids)))
+        self.blacks = array('l', itertools.repeat(0, len(self.ids)))
+        self.last_colors = array('b', itertools.repeat(Colors.NONE, len(self.ids)))
+        self.streaks = array('l', itertools.repeat(0, len(self.ids)))
+        self.indexes = dict((player_id, i) for (i, player_id) in enumerate(self.ids))
+        self.played = played if isinstance(played, PlayedPairs) else PlayedPairs(played)
+
+    def add_game(self, white, black):
+        """
+        Adds the game to the played pairs and the color history. Games must be added in chronological order.
+        :param white: white player id, None for bye
+        :type white: int
+        :param black: black player id, None for bye
+        :type black: int
+        """
+        self.played.add(white, black)
+        if white is None or black is None:
+            return
+        for (player, color) in ((white, Colors.WHITE), (black, Colors.BLACK)):
+            index = self.indexes.get(player)
+            if index is not None:
+                self.add_color(index, color)
+
+    def add_color(self, index, color):
+        if color == Colors.WHITE:
+            self.whites[index] += 1
+        else:
+            self.blacks[index] += 1
+        self.streaks[index] = self.streaks[index] + 1 if self.last_colors[index] == color else 1
+        self.last_colors[index] = color
+
+    def get_color_preference(self, index):
+        """
+        Returns (strength, color) preference of the player: absolute if the player has played one color two games
+        more than the other or two last games in a row, strong if one game more, mild to alternate otherwise.
+        :param index: player index
+        :type index: int
+        :rtype: tuple
+        """
+        difference = self.whites[index] - self.blacks[index]
+        last_color = self.last_colors[index]
+        if last_color == Colors.NONE:
+            return Preferences.NONE, Colors.NONE
+        elif self.streaks[index] > 1:
+            return Preferences.ABSOLUTE, -last_color
+        elif abs(difference) > 1:
+            return Preferences.ABSOLUTE, -cmp(difference, 0)
+        elif difference != 0:
+            return Preferences.STRONG, -difference
+        else:
+            return Preferences.MILD, -last_color
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_id(self, index):
+        return self.ids[index] if index is not None else None
+
+    def has_played(self, player, opponent):
+        """
+        :param player: player index
+        :type player: int
+        :param opponent: opponent index, None for bye
+        :type opponent: int
+        :rtype: bool
+        """
+        return (self.get_id(player), self.get_id(opponent)) in self.played
+
+    def add_pair(self, player, opponent):
+        """
+        Marks the pair of player indexes as played.
+        """
+        self.played.add(self.get_id(player), self.get_id(opponent))
+
+
+class SwissPairing(object):
+    """
+    Swiss System pairing engine. Pairs players of a TournamentState without any database access.
+    """
+
+    def __init__(self, state, rng=None):
+        """
+        :param state: tournament state
+        :type state: TournamentState
+        :param rng: random numbers generator used to resolve colors
+        :type rng: random.Random
+        """
+        self.state = state
+        self.random = rng or random
+
+    def pair(self):
+        """
+        Returns list of (white id, black id) pairs for the next round. Bye is represented by None.
+        :rtype: list
+        """
+        return self.resolve_colors(self.pair_indexes())
+
+    def pair_indexes(self):
+        """
+        Groups and pairs the players, marking the pairs as played in the state. If the players count is odd, the bye
+        is given first, so the rest are paired among themselves.
+        :returns: list of (player, opponent) index pairs, colors are not resolved yet
+        :rtype: list
+        """
+        order = self.sort()
+        bye = self.get_bye(order)
+        if bye is not None:
+            order.remove(bye)
+        pairs = list(itertools.chain.from_iterable(map(self.pair_group, self.normalize_groups(self.group(order)))))
+        if any(opponent is None for (player, opponent) in pairs):
+            pairs = self.repair(order, pairs)
+        if bye is not None:
+            pairs.append((bye, None))
+        for (player, opponent) in pairs:
+            self.state.add_pair(player, opponent)
+        return pairs
+
+    def repair(self, order, pairs):
+        """
+        Re-pairs the players some of whom were left without an opponent by the groups, by maximum cardinality matching
+        keeping as many of the pairs found as possible. Players are left unpaired only if no matching pairs them all.
+        :param order: player indexes sorted by score/rating
+        :type order: list
+        :param pairs: list of (player, opponent) index pairs found by the groups
+        :type pairs: list
+        :returns: list of (player, opponent) index pairs
+        :rtype: list
+        """
+        found = set(frozenset(pair) for pair in pairs if pair[1] is not None)
+        edges = [(i, j, 2 if frozenset((order[i], order[j])) in found else 1)
+                 for (i, j) in itertools.combinations(xrange(len(order)), 2)
+                 if not self.state.has_played(order[i], order[j])]
+        mates = max_weight_matching(edges, maxcardinality=True)
+        mates.extend(itertools.repeat(-1, len(order) - len(mates)))
+        return [(order[i], order[mates[i]] if mates[i] != -1 else None)
+                for i in xrange(len(order)) if mates[i] == -1 or mates[i] > i]
+
+    def get_bye(self, order):
+        """
+        Returns the lowest ranked player who has not got a bye yet, the lowest ranked one if all of them have.
+        :param order: player indexes sorted by score/rating
+        :type order: list
+        :returns: player index, None if the players count is even
+        :rtype: int
+        """
+        if len(order) % 2 == 0:
+            return None
+        return next(itertools.ifilterfalse(lambda player: self.state.has_played(player, None), reversed(order)),
+                    order[-1])
+
+    def resolve_colors(self, pairs):
+        """
+        :param pairs: list of (player, opponent) index pairs
+        :type pairs: list
+        :returns: list of (white id, black id) pairs
+        :rtype: list
+        """
+        return [tuple(map(self.state.get_id, self.map_colors(pair))) for pair in pairs]
+
+    def get_outcome(self, pairs):
+        """
+        Returns quality of the pairing: number of byes and of floaters (players paired outside of their score group).
+        :param pairs: list of (player, opponent) index pairs
+        :type pairs: list
+        :returns: (byes, floaters) tuple
+        :rtype: tuple
+        """
+        scores = self.state.scores
+        byes = sum(1 for (player, opponent) in pairs if opponent is None)
+        floaters = sum(2 for (player, opponent) in pairs if opponent is not None and scores[player] != scores[opponent])
+        return byes, floaters
+
+    def sort(self, indexes=None):
+        """
+        Sorts player indexes by current tournament score and rating.
+        :param indexes: player indexes. If missing - will use all the players of the state
+        :type indexes: Iterable
+        :rtype: list
+        """
+        if indexes is None:
+            indexes = xrange(len(self.state))
+        scores, ratings = self.state.scores, self.state.ratings
+        return sorted(indexes, reverse=True, key=lambda i: (scores[i], ratings[i]))
+
+    def group(self, order=None):
+        """
+        Groups player indexes by current tournament score, sorted by score/rating inside those groups.
+        :param order: player indexes sorted by score/rating. If missing - will sort all the players of the state
+        :type order: list
+        :rtype: list
+        """
+        if order is None:
+            order = self.sort()
+        return [list(igroup) for score, igroup in itertools.groupby(order, self.state.scores.__getitem__)]
+
+    def normalize_groups(self, groups):
+        """
+        Normalizes groups by making them having even number of players each (except the last one).
+        :param groups: list of groups
+        :type groups: list
+        :returns: normalized list of groups
+        :rtype: list
+        """
+        for (i, group) in enumerate(groups):
+            if len(group) % 2 != 0 and i < len(groups) - 1:
+                groups[i + 1].insert(0, group.pop())
+
+        return filter(lambda g: len(g) > 0, groups)
+
+    def pair_group(self, group):
+        """
+        Pairs the upper half of the group with the lower one, avoiding already played pairs. Players no opponent is
+        found for are paired with None.
+        :param group: list of grouped player indexes
+        :type group: list
+        :returns: list of (player, opponent) index pairs
+        :rtype: list
+        """
+        pairs = []
+        paired = set()
+        players_count = len(group)
+        opponents = group[players_count / 2:] + group[:players_count / 2]
+        is_available = lambda p, o: p != o and o not in paired and not self.state.has_played(p, o)
+
+        for (i, player) in enumerate(group):
+            if player in paired:
+                continue
+            paired.add(player)
+
+            opponent = opponents[i]
+            if not is_available(player, opponent):
+                opponent = next(itertools.ifilter(lambda o: is_available(player, o), opponents), None)
+            if opponent is not None:
+                paired.add(opponent)
+            pairs.append((player, opponent))
+
+        return pairs
+
+    def map_colors(self, pair):
+        """
+        Returns (white, black) pair of player indexes. Color preferences of both players are granted if they are
+        compatible, otherwise the stronger one wins, and the higher ranked player's one if they are equally strong.
+        Colors of players without any preference are drawn at random.
+        :param pair: pair of player indexes
+        :type pair: tuple
+        :rtype: tuple
+        """
+        player, opponent = pair
+        if opponent is None:
+            return pair
+
+        player_strength, player_color = self.state.get_color_preference(player)
+        opponent_strength, opponent_color = self.state.get_color_preference(opponent)
+        if player_color == opponent_color == Colors.NONE:
+            return tuple(self.random.sample(pair, 2))
+
+        scores, ratings = self.state.scores, self.state.ratings
+        if (player_strength, scores[player], ratings[player]) < (opponent_strength, scores[opponent], ratings[opponent]):
+            return (opponent, player) if opponent_color == Colors.WHITE else pair
+        return pair if player_color == Colors.WHITE else (opponent, player)
+
+
+class MatchingPairing(SwissPairing):
+    """
+    Swiss System pairing engine treating the round as a maximum weight matching problem.
+    Players are matched in blocks of bounded size going down the standings, so the running time grows
+    linearly with the number of players. Rematches are never allowed; within a block pairs are weighted by
+    the score difference, color preferences and the distance from the Swiss fold of the score group.
+    """
+    BLOCK_SIZE = 64
+    SCORE_WEIGHT = 1000
+    COLOR_WEIGHT = 100
+    FOLD_WEIGHT = 1
+
+    def pair_indexes(self):
+        """
+        Pairs the players block by block, marking the pairs as played in the state.
+        :returns: list of (player, opponent) index pairs, colors are not resolved yet
+        :rtype: list
+        """
+        order = self.sort()
+        max_score = max(self.state.scores) if len(self.state) else 0.0
+        self.max_weight = self.SCORE_WEIGHT * int(round(2 * max_score)) ** 2 + self.BLOCK_SIZE ** 2
+        halves = dict((player, len(group) / 2) for group in self.group() for player in group)
+        pairs = []
+        block = []
+
+        for start in xrange(0, len(order), self.BLOCK_SIZE):
+            block.extend(order[start:start + self.BLOCK_SIZE])
+            is_last = start + self.BLOCK_SIZE >= len(order)
+            floater = block.pop() if len(block) % 2 != 0 and not is_last else None
+            block_pairs, block = self.pair_block(block, halves, with_bye=is_last)
+            pairs.extend(block_pairs)
+            if floater is not None:
+                block.append(floater)
+
+        # Players no opponent was found for get a bye.
+        pairs.extend((player, None) for player in block)
+        for (player, opponent) in pairs:
+            self.state.add_pair(player, opponent)
+        return pairs
+
+    def pair_block(self, block, halves, with_bye=False):
+        """
+        Pairs the block of players by maximum weight matching of maximum cardinality.
+        :param block: player indexes sorted by score/rating
+        :type block: list
+        :param halves: half sizes of the score groups, by player index
+        :type halves: dict
+        :param with_bye: whether a bye can be given to one of the players of an odd sized block
+        :type with_bye: bool
+        :returns: list of (player, opponent) index pairs and list of the players left unpaired
+        :rtype: tuple
+        """
+        bye = len(block)
+        edges = [(i, j, self.get_weight(block, halves, i, j))
+                 for (i, j) in itertools.combinations(xrange(len(block)), 2)
+                 if not self.state.has_played(block[i], block[j])]
+        if with_bye and len(block) % 2 != 0:
+            edges.extend((i, bye, self.get_bye_weight(block, i))
+                         for i in xrange(len(block)) if not self.state.has_played(block[i], None))
+
+        mates = max_weight_matching(edges, maxcardinality=True)
+        mates.extend(itertools.repeat(-1, len(block) + 1 - len(mates)))
+
+        pairs = [(block[i], block[mates[i]] if mates[i] != bye else None)
+                 for i in xrange(len(block)) if mates[i] > i]
+        unpaired = [block[i] for i in xrange(len(block)) if mates[i] == -1]
+        return pairs, unpaired
+
+    def get_weight(self, block, halves, i, j):
+        player, opponent = block[i], block[j]
+        scores = self.state.scores
+
+        score_difference = int(round(2 * abs(scores[player] - scores[opponent])))
+        player_strength, player_color = self.state.get_color_preference(player)
+        opponent_strength, opponent_color = self.state.get_color_preference(opponent)
+        color_conflict = min(player_strength, opponent_strength) if player_color == opponent_color else 0
+        fold_distance = abs(j - i - halves[player])
+
+        return self.max_weight - self.SCORE_WEIGHT * score_difference ** 2 \
+            - self.COLOR_WEIGHT * color_conflict - self.FOLD_WEIGHT * fold_distance
+
+    def get_bye_weight(self, block, i):
+        # Bye is weighted as a game against a zero scored opponent, so the lowest ranked player gets it.
+        score_difference = int(round(2 * self.state.scores[block[i]]))
+        return self.max_weight - self.SCORE_WEIGHT * score_difference ** 2 - self.FOLD_WEIGHT * (len(block) - i)
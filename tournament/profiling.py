@@ -0,0 +1,296 @@
+# -*- encoding: utf-8 -*-
+"""
+Measurements of the wall time, database queries and memory of the blocks of code and of the requests.
+"""
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, reset_queries
+from django.template.base import Template
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def get_peak_memory():
+    """
+    Returns peak resident memory of the process in megabytes, None if it is not available on the platform.
+    :rtype: float
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, OS X reports bytes.
+    return peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+
+class Phase(object):
+    """
+    Context manager measuring the wall time, the number and the time of the database queries and the peak memory
+    of a block of code. Queries are recorded for the duration of the block even with DEBUG off. Phases can be nested,
+    the outermost one discards the recorded queries afterwards so long runs don't keep them all in memory.
+    """
+
+    def __init__(self, name, **labels):
+        """
+        :param name: name of the phase
+        :type name: basestring
+        :param labels: additional values reported along with the measurements
+        """
+        self.name = name
+        self.labels = labels
+        self.seconds = self.queries = self.query_seconds = self.peak_memory = None
+
+    def __enter__(self):
+        self.use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        self.first_query = len(connection.queries)
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = time.time() - self.started
+        queries = connection.queries[self.first_query:]
+        self.queries = len(queries)
+        self.query_seconds = sum(float(query['time']) for query in queries)
+        self.peak_memory = get_peak_memory()
+        self.collect(queries)
+        connection.use_debug_cursor = self.use_debug_cursor
+        if not self.use_debug_cursor and not settings.DEBUG:
+            reset_queries()
+
+    def collect(self, queries):
+        """
+        Called with the queries of the phase before they are discarded.
+        :param queries: list of { "sql": statement, "time": seconds } dicts
+        :type queries: list
+        """
+        pass
+
+    def as_dict(self):
+        """
+        :rtype: OrderedDict
+        """
+        result = OrderedDict((('phase', self.name),))
+        result.update(sorted(self.labels.iteritems()))
+        result.update((('seconds', self.seconds), ('queries', self.queries), ('query_seconds', self.query_seconds),
+                       ('peak_memory_mb', self.peak_memory)))
+        return result
+
+
+class Profile(object):
+    """
+    Phases of an operation, in the order they were started. Nested phases have depth of their nesting level.
+    Counts describing the outcome of the operation can be set to `outcome` dict.
+    """
+
+    def __init__(self):
+        self.phases = []
+        self.depth = 0
+        self.outcome = {}
+
+    @contextmanager
+    def phase(self, name, **labels):
+        phase = Phase(name, depth=self.depth, **labels)
+        self.phases.append(phase)
+        self.depth += 1
+        try:
+            with phase:
+                yield phase
+        finally:
+            self.depth -= 1
+
+    def as_list(self):
+        """
+        Returns the finished phases as lists of name, depth, seconds, number of queries and query seconds.
+        :rtype: list
+        """
+        return [[phase.name, phase.labels['depth'], phase.seconds, phase.queries, phase.query_seconds]
+                for phase in self.phases if phase.seconds is not None]
+
+
+# Literals are replaced, so the statements differing only in their parameters have the same fingerprint.
+FINGERPRINT_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\?(?:, \?)*\)'), '(...)'),
+)
+
+# Profiling is opt-in: no requests are profiled unless the sample rate is set in the settings or by the command.
+DEFAULT_SAMPLE_RATE = getattr(settings, 'TOURNAMENT_PROFILING_SAMPLE_RATE', 0.0)
+# The sample rate shared through the database is re-read that often, so each request costs no query.
+SAMPLE_RATE_CHECK_INTERVAL = 5
+
+_local = threading.local()
+_sample_rate = {'value': DEFAULT_SAMPLE_RATE, 'expires': 0}
+
+
+def get_fingerprint(sql):
+    for (pattern, replacement) in FINGERPRINT_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def get_sample_rate():
+    """
+    Returns share of the requests to profile, from 0 to 1.
+    :rtype: float
+    """
+    from .models import ProfilingSwitch
+
+    now = time.time()
+    if now >= _sample_rate['expires']:
+        rate = next(iter(ProfilingSwitch.objects.filter(pk=ProfilingSwitch.ID).values_list('sample_rate', flat=True)),
+                    None)
+        _sample_rate.update(value=rate if rate is not None else DEFAULT_SAMPLE_RATE,
+                            expires=now + SAMPLE_RATE_CHECK_INTERVAL)
+    return _sample_rate['value']
+
+
+def set_sample_rate(rate):
+    """
+    Sets share of the requests to profile for all the processes sharing the database.
+    :param rate: share from 0 to 1, None to fall back to the TOURNAMENT_PROFILING_SAMPLE_RATE setting
+    :type rate: float
+    """
+    from .models import ProfilingSwitch
+
+    if rate is None:
+        ProfilingSwitch.objects.filter(pk=ProfilingSwitch.ID).delete()
+    else:
+        ProfilingSwitch(pk=ProfilingSwitch.ID, sample_rate=rate).save()
+    _sample_rate['expires'] = 0
+
+
+def instrument_templates():
+    """
+    Wraps Template.render to time the outermost template render of the profiled requests. Renders outside of them
+    only pay for a thread local lookup.
+    """
+    if getattr(Template.render, 'profiled', False):
+        return
+    render = Template.render
+
+    @wraps(render)
+    def profiled_render(self, context):
+        profile = getattr(_local, 'profile', None)
+        if profile is None or profile.rendering:
+            return render(self, context)
+        profile.rendering = True
+        started = time.time()
+        try:
+            return render(self, context)
+        finally:
+            profile.render_seconds += time.time() - started
+            profile.rendering = False
+
+    profiled_render.profiled = True
+    Template.render = profiled_render
+
+
+class RequestProfile(Phase):
+    """
+    Phase of a request. Besides the Phase measurements keeps the template render time, the statements executed more
+    than once with different parameters only, which are the N+1 query patterns, and the slowest statements.
+    """
+    STATEMENTS_COUNT = 5
+    SQL_LENGTH = 500
+
+    def __init__(self, request):
+        super(RequestProfile, self).__init__('request', method=request.method, path=request.path)
+        self.view = self.status = None
+        self.render_seconds = 0.0
+        self.rendering = False
+        self.duplicates = self.slowest = ()
+
+    def __enter__(self):
+        _local.profile = self
+        return super(RequestProfile, self).__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.profile = None
+        super(RequestProfile, self).__exit__(exc_type, exc_value, traceback)
+
+    def collect(self, queries):
+        fingerprints = Counter(get_fingerprint(query['sql']) for query in queries)
+        self.duplicates = [(fingerprint[:self.SQL_LENGTH], count)
+                           for (fingerprint, count) in fingerprints.most_common(self.STATEMENTS_COUNT) if count > 1]
+        slowest = sorted(queries, key=lambda query: float(query['time']), reverse=True)[:self.STATEMENTS_COUNT]
+        self.slowest = [(query['sql'][:self.SQL_LENGTH], float(query['time'])) for query in slowest]
+
+    def as_dict(self):
+        result = super(RequestProfile, self).as_dict()
+        result.update((('view', self.view), ('status', self.status), ('render_seconds', self.render_seconds),
+                       ('duplicates', self.duplicates), ('slowest', self.slowest)))
+        return result
+
+
+class RequestLog(object):
+    """
+    In-process ring buffer of the profiles of the latest requests.
+    """
+
+    def __init__(self, size):
+        self.records = deque(maxlen=size)
+
+    def add(self, profile):
+        """
+        :type profile: RequestProfile
+        """
+        self.records.append(profile.as_dict())
+
+    def aggregate(self, statements_count=10):
+        """
+        Returns measurements of the buffered requests aggregated by view, with the most duplicated and the slowest
+        statements among all of them.
+        :rtype: dict
+        """
+        records = list(self.records)
+        views = defaultdict(list)
+        for record in records:
+            views[record['view'] or record['path']].append(record)
+
+        duplicates = {}
+        for record in records:
+            for (fingerprint, count) in record['duplicates']:
+                worst = duplicates.get(fingerprint)
+                if worst is None or count > worst['count']:
+                    duplicates[fingerprint] = {'fingerprint': fingerprint, 'count': count, 'view': record['view'],
+                                               'path': record['path']}
+        slowest = sorted(({'sql': sql, 'seconds': seconds, 'view': record['view'], 'path': record['path']}
+                          for record in records for (sql, seconds) in record['slowest']),
+                         key=lambda statement: statement['seconds'], reverse=True)
+
+        return {
+            'requests': len(records),
+            'views': sorted((self.aggregate_view(view, view_records) for (view, view_records) in views.iteritems()),
+                            key=lambda view: view['total_seconds'], reverse=True),
+            'duplicates': sorted(duplicates.itervalues(), key=lambda duplicate: duplicate['count'],
+                                 reverse=True)[:statements_count],
+            'slowest': slowest[:statements_count],
+        }
+
+    def aggregate_view(self, view, records):
+        count = len(records)
+        return OrderedDict((
+            ('view', view),
+            ('requests', count),
+            ('total_seconds', sum(record['seconds'] for record in records)),
+            ('mean_seconds', sum(record['seconds'] for record in records) / count),
+            ('max_seconds', max(record['seconds'] for record in records)),
+            ('mean_render_seconds', sum(record['render_seconds'] for record in records) / count),
+            ('mean_queries', sum(record['queries'] for record in records) / float(count)),
+            ('max_queries', max(record['queries'] for record in records)),
+            ('mean_query_seconds', sum(record['query_seconds'] for record in records) / count),
+        ))
+
+
+REQUEST_LOG = RequestLog(getattr(settings, 'TOURNAMENT_PROFILING_BUFFER_SIZE', 1000))
@@ -0,0 +1,216 @@
+# -*- encoding: utf-8 -*-
+import collections
+import itertools
+import operator
+
+from django.db import models, transaction
+import numpy
+
+from .models import Game, Player, RatingChange, RatingCheckpoint, RatingSnapshot, Score, Standing, Tournament
+from .tournament import chunked, get_elo_changes, update_column
+
+
+class RatingReplay(object):
+    """
+    Recomputes the rating history: replays all the finished tournaments in chronological order, recomputing
+    rating deltas of their scores, standings and rating snapshots from the baseline ratings, along with the players
+    ratings.
+    Tournaments are replayed one by one streaming their scores, so the memory used is bounded by the number of
+    players and the size of the largest tournament. Changes of the ratings by the replayed tournaments are
+    checkpointed periodically, so the replay can be resumed or started from the last checkpoint before the earliest
+    affected tournament. The checkpointed changes are applied to the baseline, so the rating changes made outside
+    of the tournaments after the checkpoint are kept, the same way a full replay keeps them.
+    """
+    BATCH_SIZE = 500
+
+    def __init__(self, checkpoint_interval=100, callback=None):
+        """
+        :param checkpoint_interval: number of tournaments replayed between checkpoints
+        :type checkpoint_interval: int
+        :param callback: function called with (tournament id, replayed count, total count) after each tournament
+        :type callback: callable
+        """
+        self.checkpoint_interval = checkpoint_interval
+        self.callback = callback
+
+    def run(self, since=None, resume=False):
+        """
+        Replays the tournaments.
+        :param since: id of the earliest tournament affected by the changes. If missing - replays all tournaments
+        :type since: int
+        :param resume: whether to resume the replay from the latest checkpoint
+        :type resume: bool
+        :returns: number of replayed tournaments
+        :rtype: int
+        """
+        tournaments = list(Tournament.objects.filter(finished=True).order_by('end_date', 'id')
+                           .values_list('id', flat=True))
+        positions = dict((tournament_id, i) for (i, tournament_id) in enumerate(tournaments))
+        if since is not None and since not in positions:
+            raise UserWarning(u'Tournament #%s is not finished' % since)
+
+        baseline = self.get_baseline()
+        ratings = dict(baseline)
+        start = 0
+        if resume or since is not None:
+            checkpoint = self.get_checkpoint(positions, len(tournaments) if resume else positions[since])
+            if checkpoint is not None:
+                for (player_id, delta) in checkpoint.get_deltas().iteritems():
+                    if player_id in ratings:
+                        ratings[player_id] += delta
+                start = positions[checkpoint.tournament_id] + 1
+
+        # Checkpoints after the starting point are no longer valid.
+        for tournament_ids in chunked(tournaments[start:], self.BATCH_SIZE):
+            RatingCheckpoint.objects.filter(tournament__in=tournament_ids).delete()
+
+        for (i, tournament_id) in enumerate(tournaments[start:], start + 1):
+            self.replay_tournament(tournament_id, ratings)
+            if i % self.checkpoint_interval == 0 or i == len(tournaments):
+                self.save_checkpoint(tournament_id, ratings, baseline)
+            if self.callback is not None:
+                self.callback(tournament_id, i, len(tournaments))
+        return len(tournaments) - start
+
+    def get_baseline(self):
+        """
+        Returns ratings of the players before their first finished tournament: current ratings without the changes
+        made by finished tournaments. Recorded rating changes are used where available, summary rating deltas of
+        the scores otherwise. The players ratings are updated along with the changes of every replayed tournament,
+        so the baseline is the same whenever a replay is started or resumed.
+        :returns: dict of { player id: rating }
+        :rtype: dict
+        """
+        ratings = dict(Player.objects.values_list('id', 'rating').iterator())
+        recorded = set(RatingChange.objects.values_list('tournament', flat=True).distinct())
+
+        changes = RatingChange.objects.filter(tournament__finished=True).values_list('player', 'rating_before',
+                                                                                     'rating_after')
+        for (player_id, rating_before, rating_after) in changes.iterator():
+            ratings[player_id] -= rating_after - rating_before
+
+        deltas = Score.objects.filter(game__round__tournament__finished=True) \
+            .values_list('player', 'game__round__tournament').annotate(models.Sum('rating_delta'))
+        for (player_id, tournament_id, delta) in deltas.iterator():
+            if tournament_id not in recorded:
+                ratings[player_id] -= int(round(delta or 0.0))
+
+        return ratings
+
+    def get_checkpoint(self, positions, limit):
+        """
+        Returns the latest checkpoint made before the tournament at the given chronological position.
+        :rtype: RatingCheckpoint
+        """
+        checkpoints = [(positions[tournament_id], checkpoint_id) for (checkpoint_id, tournament_id)
+                       in RatingCheckpoint.objects.values_list('id', 'tournament')
+                       if positions.get(tournament_id, limit) < limit]
+        return RatingCheckpoint.objects.get(pk=max(checkpoints)[1]) if checkpoints else None
+
+    def save_checkpoint(self, tournament_id, ratings, baseline):
+        checkpoint = RatingCheckpoint(tournament_id=tournament_id)
+        checkpoint.set_deltas(dict((player_id, rating - baseline[player_id])
+                                   for (player_id, rating) in ratings.iteritems() if rating != baseline[player_id]))
+        checkpoint.save()
+
+    def replay_tournament(self, tournament_id, ratings):
+        """
+        Recomputes rating deltas of the tournament scores and standings, the players rating changes and rating
+        snapshots with the replayed ratings, and corrects the players ratings by the difference of the changes.
+        :param tournament_id: tournament id
+        :type tournament_id: int
+        :param ratings: replayed ratings, updated in place
+        :type ratings: dict
+        """
+        players = dict((player_id, Player(id=player_id, rating=ratings[player_id], fide_id=fide_id,
+                                          fide_games=fide_games))
+                       for (player_id, fide_id, fide_games) in Player.objects.filter(tournament=tournament_id)
+                       .values_list('id', 'fide_id', 'fide_games'))
+
+        # Scores of each game are consecutive, the opponent of each side is the player of the other one.
+        sides = []
+        scores = Score.objects.filter(game__round__tournament=tournament_id).order_by('game') \
+            .values_list('id', 'game', 'game__round', 'player', 'score')
+        for (game_id, game_scores) in itertools.groupby(scores.iterator(), operator.itemgetter(1)):
+            game_scores = list(game_scores)
+            for (score_id, game_id, round_id, player_id, score) in game_scores:
+                opponents = [side[3] for side in game_scores if side[0] != score_id]
+                sides.append((score_id, round_id, player_id, opponents[0] if opponents else None, score))
+                if player_id not in players:
+                    # The player has been removed from the tournament after playing in it.
+                    players[player_id] = Player(id=player_id, rating=ratings[player_id])
+
+        game = Game()
+        expectations, deltas = get_elo_changes(
+            ratings=[players[player_id].rating for (score_id, round_id, player_id, opponent_id, score) in sides],
+            opponent_ratings=[players[opponent_id].rating if opponent_id is not None else numpy.nan
+                              for (score_id, round_id, player_id, opponent_id, score) in sides],
+            k_factors=[game.get_k(players[player_id])
+                       for (score_id, round_id, player_id, opponent_id, score) in sides],
+            scores=[score for (score_id, round_id, player_id, opponent_id, score) in sides])
+
+        round_deltas = collections.defaultdict(float)
+        for ((score_id, round_id, player_id, opponent_id, score), delta) in itertools.izip(sides, deltas):
+            round_deltas[player_id, round_id] += delta
+        rounds = sorted(set(round_id for (player_id, round_id) in round_deltas))
+
+        # Provisional rating after each round includes deltas of all the rounds so far, the final one - all of them.
+        snapshot_ratings = {}
+        summary_deltas = {}
+        for (player_id, player) in players.iteritems():
+            summary_delta = 0.0
+            for round_id in rounds:
+                summary_delta += round_deltas.get((player_id, round_id), 0.0)
+                snapshot_ratings[player_id, round_id] = player.rating + int(round(summary_delta))
+            snapshot_ratings[player_id, None] = player.rating + int(round(summary_delta))
+            summary_deltas[player_id] = summary_delta
+
+        changes = [RatingChange(tournament_id=tournament_id, player_id=player_id, rating_before=player.rating,
+                                rating_after=snapshot_ratings[player_id, None])
+                   for (player_id, player) in players.iteritems()]
+        score_updates = [(float(delta), side[0]) for (side, delta) in itertools.izip(sides, deltas)]
+        snapshot_updates = [(snapshot_ratings[player_id, round_id], snapshot_id)
+                            for (snapshot_id, round_id, player_id)
+                            in RatingSnapshot.objects.filter(tournament=tournament_id)
+                            .values_list('id', 'round', 'player').iterator()
+                            if (player_id, round_id) in snapshot_ratings]
+        standing_updates = [(summary_deltas[player_id], standing_id)
+                            for (standing_id, player_id) in Standing.objects.filter(tournament=tournament_id)
+                            .values_list('id', 'player').iterator()
+                            if player_id in summary_deltas]
+
+        previous = self.get_previous_changes(tournament_id)
+        corrections = [(change.rating_delta() - previous.get(change.player_id, 0), change.player_id)
+                       for change in changes]
+        corrections = sorted(correction for correction in corrections if correction[0] != 0)
+
+        with transaction.commit_on_success():
+            update_column(Score, 'rating_delta', score_updates, self.BATCH_SIZE)
+            update_column(RatingSnapshot, 'rating', snapshot_updates, self.BATCH_SIZE)
+            update_column(Standing, 'rating_delta', standing_updates, self.BATCH_SIZE)
+            RatingChange.objects.filter(tournament=tournament_id).delete()
+            RatingChange.objects.bulk_create(changes)
+            # Players are updated in groups by correction, keeping the changes made outside of the tournaments.
+            for (correction, group) in itertools.groupby(corrections, operator.itemgetter(0)):
+                for player_ids in chunked((player_id for (correction, player_id) in group), self.BATCH_SIZE):
+                    Player.objects.filter(pk__in=player_ids).update(rating=models.F('rating') + correction)
+            Tournament.touch_players([player_id for (correction, player_id) in corrections], self.BATCH_SIZE)
+            Tournament.objects.filter(pk=tournament_id).update(version=models.F('version') + 1)
+
+        ratings.update((change.player_id, change.rating_after) for change in changes)
+
+    def get_previous_changes(self, tournament_id):
+        """
+        Returns the rating changes made by the tournament before it is replayed: the recorded ones if any, summary
+        rating deltas of the scores otherwise, the same as get_baseline takes.
+        :returns: dict of { player id: rating change }
+        :rtype: dict
+        """
+        changes = RatingChange.objects.filter(tournament=tournament_id).values_list('player', 'rating_before',
+                                                                                    'rating_after')
+        if changes.exists():
+            return dict((player_id, rating_after - rating_before)
+                        for (player_id, rating_before, rating_after) in changes.iterator())
+        deltas = Score.objects.filter(game__round__tournament=tournament_id).values_list('player') \
+            .annotate(models.Sum('rating_delta'))
+        return dict((player_id, int(round(delta or 0.0))) for (player_id, delta) in deltas.iterator())
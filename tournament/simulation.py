@@ -0,0 +1,145 @@
+# -*- encoding: utf-8 -*-
+"""
+Reproducible synthetic tournaments for load testing. Run them with `manage.py simulate_tournament`.
+"""
+from contextlib import contextmanager
+from datetime import date
+import random
+
+from django.contrib.auth.models import User
+
+from .models import Pairings, Player, Side, Tournament
+from .profiling import Phase
+
+# Simulated players get FIDE ids above the ones FIDE has issued, so they can be told apart from the real ones.
+FIDE_ID_OFFSET = 900000000
+# FIDE rating floor and roughly the top rating, the ratings in between are about normally distributed.
+MIN_RATING = 1000
+MAX_RATING = 2850
+MEAN_RATING = 1700
+RATING_DEVIATION = 300
+
+
+class TournamentSimulation(object):
+    """
+    Creates players and a tournament, then drives the tournament through SwissSystemMixin.progress(), entering
+    results drawn from the Elo expectations of the games. Everything random is drawn from a single seeded generator,
+    so the same seed gives the same tournament.
+    """
+    BATCH_SIZE = 500
+    REFEREE_USERNAME = 'simulation'
+
+    def __init__(self, players_count, seed=0, pairing=Pairings.GREEDY, rounds=None, draw_rate=0.3, callback=None):
+        """
+        :param players_count: number of the players to create
+        :type players_count: int
+        :param seed: seed of the random numbers generator
+        :type seed: int
+        :param pairing: pairing engine of the tournament, one of Pairings
+        :type pairing: str
+        :param rounds: number of the rounds to play. If missing - the tournament is played until it is finished
+        :type rounds: int
+        :param draw_rate: probability of a draw between equally rated players
+        :type draw_rate: float
+        :param callback: function called with every finished Phase
+        :type callback: callable
+        """
+        self.players_count = players_count
+        self.seed = seed
+        self.pairing = pairing
+        self.rounds = rounds
+        self.draw_rate = draw_rate
+        self.callback = callback
+        self.random = random.Random(seed)
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name, **labels):
+        with Phase(name, **labels) as phase:
+            yield phase
+        self.phases.append(phase)
+        if self.callback is not None:
+            self.callback(phase)
+
+    def run(self):
+        """
+        :returns: the simulated tournament
+        :rtype: Tournament
+        """
+        with self.phase('players', players=self.players_count):
+            players = self.create_players()
+        with self.phase('tournament', players=self.players_count):
+            tournament = self.create_tournament(players)
+        ratings = dict(tournament.players.values_list('id', 'rating'))
+
+        round_number = 0
+        while self.rounds is None or round_number < self.rounds:
+            with self.phase('progress', round=round_number + 1):
+                current_round = tournament.progress(seed=self.random.randint(0, 2 ** 31))
+            if current_round is None:
+                break
+            round_number += 1
+            with self.phase('results', round=round_number, games=len(current_round.games)):
+                tournament.update_results(current_round, self.play(current_round.games, ratings), finish_round=True)
+        return tournament
+
+    def create_players(self):
+        """
+        Creates the players, rated players being normally distributed around the mean rating. Some of them are new
+        to FIDE, so every K-factor is used.
+        :returns: ids of the created players
+        :rtype: list
+        """
+        first = next(iter(Player.objects.filter(fide_id__gte=FIDE_ID_OFFSET).order_by('-fide_id')
+                          .values_list('fide_id', flat=True)[:1]), FIDE_ID_OFFSET) + 1
+        players = []
+        for fide_id in xrange(first, first + self.players_count):
+            rating = int(min(max(self.random.gauss(MEAN_RATING, RATING_DEVIATION), MIN_RATING), MAX_RATING))
+            players.append(Player(name=u'Simulated player %d' % (fide_id - FIDE_ID_OFFSET), country='', rating=rating,
+                                  fide_id=fide_id, fide_games=int(self.random.expovariate(1 / 200.0))))
+        Player.objects.bulk_create(players, batch_size=self.BATCH_SIZE)
+        return list(Player.objects.filter(fide_id__gte=first).values_list('id', flat=True))
+
+    def create_tournament(self, players):
+        """
+        :param players: ids of the players of the tournament
+        :type players: Iterable
+        :rtype: Tournament
+        """
+        referee = User.objects.get_or_create(username=self.REFEREE_USERNAME)[0].refereeprofile
+        tournament = Tournament.objects.create(
+            name=u'Simulation of %d players, seed %d' % (self.players_count, self.seed), referee=referee,
+            start_date=date.today(), finished=False, pairing=self.pairing)
+        # Players are added in bulk, bypassing the receiver rebuilding the standings on every add.
+        membership = Tournament.players.through
+        membership.objects.bulk_create([membership(tournament=tournament, player_id=player_id)
+                                        for player_id in players], batch_size=self.BATCH_SIZE)
+        tournament.update_standings()
+        return tournament
+
+    def play(self, games, ratings):
+        """
+        Draws results of the games: white wins with probability of its Elo expectation reduced by half of the draw
+        probability, so the expected score matches the expectation. Bye is a win.
+        :param games: games of the round
+        :type games: list
+        :param ratings: dict of { player id: rating }
+        :type ratings: dict
+        :returns: dict of { game id: (finished, winner) }
+        :rtype: dict
+        """
+        results = {}
+        for game in games:
+            if game.white_id is None or game.black_id is None:
+                results[game.pk] = (True, Side.WHITE if game.black_id is None else Side.BLACK)
+                continue
+            expectation = 1.0 / (1 + 10 ** ((ratings[game.black_id] - ratings[game.white_id]) / 400.0))
+            draw = min(self.draw_rate, 2 * min(expectation, 1 - expectation))
+            value = self.random.random()
+            if value < expectation - draw / 2:
+                results[game.pk] = (True, Side.WHITE)
+            elif value < expectation + draw / 2:
+                results[game.pk] = (True, None)
+            else:
+                results[game.pk] = (True, Side.BLACK)
+        return results
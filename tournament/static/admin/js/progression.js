@@ -0,0 +1,30 @@
+/**
+ * Polls status of the round progression job shown on the tournament change form, reloading the page once the job
+ * is over so the new round is shown.
+ */
+(function ($) {
+    var ACTIVE_STATUSES = ['queued', 'running'];
+    var INTERVAL = 2000;
+
+    $(function () {
+        var status = $('#progression-status');
+        if (!status.length || $.inArray(status.data('status'), ACTIVE_STATUSES) === -1) {
+            return;
+        }
+
+        var poll = function () {
+            $.getJSON(status.data('url'), function (job) {
+                if (job === null) {
+                    return;
+                }
+                status.text(job.description);
+                if ($.inArray(job.status, ACTIVE_STATUSES) === -1) {
+                    window.location.reload();
+                } else {
+                    setTimeout(poll, INTERVAL);
+                }
+            });
+        };
+        setTimeout(poll, INTERVAL);
+    });
+})(django.jQuery);
@@ -0,0 +1,663 @@
+# -*- encoding: utf-8 -*-
+from datetime import date, timedelta
+import itertools
+import json
+import random
+from StringIO import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import models
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from . import jobs, profiling
+from .exports import export_trf
+from .fide import FideRecord, RatingListImport, parse_xml
+from .forms import RoundResultsForm
+from .matching import max_weight_matching
+from .models import JobStatuses, Player, ProgressionJob, ProgressionLog, RatingChange, Score, Side, Standing, Tournament
+from .pairing import MatchingPairing, SwissPairing, TournamentState
+from .replay import RatingReplay
+from .tiebreaks import Tiebreaks
+from .tournament import get_elo_changes
+
+
+def create_tournament(players_count, name=u'Tournament'):
+    """
+    Creates a tournament of the players rated from 2000 down, in steps of 10.
+    :rtype: Tournament
+    """
+    referee = User.objects.get_or_create(username='referee')[0].refereeprofile
+    tournament = Tournament.objects.create(name=name, referee=referee, start_date=date(2013, 5, 1), finished=False)
+    names = [u'Tournament %d player %d' % (tournament.pk, i) for i in xrange(players_count)]
+    Player.objects.bulk_create([Player(name=player_name, country='BY', rating=2000 - 10 * i)
+                                for (i, player_name) in enumerate(names)])
+    tournament.players.add(*Player.objects.filter(name__in=names))
+    return tournament
+
+
+def play_round(tournament, get_winner=lambda game: Side.WHITE):
+    """
+    Starts the next round of the tournament and finishes all its games.
+    :param get_winner: function returning the winner of the game, None for a draw. Byes are won
+    :type get_winner: callable
+    :rtype: Round
+    """
+    current_round = tournament.progress(seed=0)
+    results = dict((game.pk, (True, get_winner(game) if game.black_id is not None else Side.WHITE))
+                   for game in current_round.games)
+    tournament.update_results(current_round, results, finish_round=True)
+    return current_round
+
+
+class TiebreaksTest(TestCase):
+    def test_no_results(self):
+        tiebreaks = Tiebreaks([1, 2, 3], [])
+        for player_id in (1, 2, 3):
+            self.assertEqual(tiebreaks.get(player_id), dict.fromkeys(Tiebreaks.ORDER, 0.0))
+        self.assertEqual(Tiebreaks([], []).get(1), dict.fromkeys(Tiebreaks.ORDER, 0.0))
+
+    def test_round_without_draws(self):
+        # Winners and losers never have equal points, so nobody has a direct encounter score.
+        tiebreaks = Tiebreaks([1, 2, 3, 4, 5], [(1, 1, 2, 1.0), (1, 2, 1, 0.0), (1, 3, 4, 0.0), (1, 4, 3, 1.0),
+                                                (1, 5, None, 1.0)])
+        self.assertEqual(tiebreaks.get(1), {Tiebreaks.BUCHHOLZ: 0.0, Tiebreaks.MEDIAN_BUCHHOLZ: 0.0,
+                                            Tiebreaks.SONNEBORN_BERGER: 0.0, Tiebreaks.PROGRESSIVE: 1.0,
+                                            Tiebreaks.DIRECT_ENCOUNTER: 0.0})
+        self.assertEqual(tiebreaks.get(3)[Tiebreaks.BUCHHOLZ], 1.0)
+        self.assertEqual(tiebreaks.get(5)[Tiebreaks.BUCHHOLZ], 0.0)
+
+    def test_unstarted_tournament_page(self):
+        tournament = create_tournament(5)
+        self.assertEqual(tournament.get_tiebreaks().get(tournament.players.all()[0].pk),
+                         dict.fromkeys(Tiebreaks.ORDER, 0.0))
+        response = self.client.get(reverse('tournament:tournament_detail', args=[tournament.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_page_and_api_rankings_match(self):
+        tournament = create_tournament(9)
+        play_round(tournament)
+        play_round(tournament, lambda game: None if game.white.rating > 1950 else Side.BLACK)
+
+        tiebreaks = tournament.get_tiebreaks()
+        page_order = [player.pk for player in tournament.get_standings().get_players(tiebreaks)]
+        expected = sorted(tournament.players.all(), reverse=True, key=lambda player: (
+            tournament.standing_set.get(player=player).points,) + tiebreaks.get_key(player.pk) + (player.rating,))
+        self.assertEqual(page_order, [player.pk for player in expected])
+
+        response = self.client.get(reverse('tournament:api_standings', args=[tournament.pk]))
+        payload = json.loads(response.content)
+        player = payload['fields'].index('player')
+        self.assertEqual([row[player] for row in payload['rows']], page_order)
+
+
+class StandingsTest(TestCase):
+    def setUp(self):
+        self.tournament = create_tournament(6)
+        self.round = play_round(self.tournament)
+        self.game = self.round.game_set.exclude(black=None).select_related('white', 'black').order_by('id')[0]
+
+    def get_standings(self):
+        return dict((standing.player_id, (standing.points, standing.games_played, standing.rank))
+                    for standing in self.tournament.standing_set.all())
+
+    def test_game_save(self):
+        before = self.get_standings()
+        self.game.winner = Side.BLACK
+        self.game.save()
+        after = self.get_standings()
+
+        white, black = self.game.white_id, self.game.black_id
+        self.assertEqual(after[white], (0.0, 1, before[white][2]))
+        self.assertEqual(after[black], (1.0, 1, before[black][2]))
+        for player_id in set(before) - set([white, black]):
+            self.assertEqual(after[player_id], before[player_id])
+
+    def test_unfinished_game(self):
+        self.game.finished = False
+        self.game.winner = None
+        self.game.save()
+        standings = self.get_standings()
+        self.assertFalse(self.game.score_set.exists())
+        self.assertEqual(standings[self.game.white_id][:2], (0.0, 0))
+        self.assertEqual(standings[self.game.black_id][:2], (0.0, 0))
+
+    def test_game_delete(self):
+        self.game.delete()
+        standings = self.get_standings()
+        self.assertEqual(standings[self.game.white_id][:2], (0.0, 0))
+        self.assertEqual(standings[self.game.black_id][:2], (0.0, 0))
+
+    def test_round_delete(self):
+        self.round.delete()
+        self.assertEqual(set(row[:2] for row in self.get_standings().itervalues()), set([(0.0, 0)]))
+
+    def test_tournament_delete(self):
+        tournament_id = self.tournament.pk
+        self.tournament.delete()
+        self.assertFalse(Standing.objects.filter(tournament=tournament_id).exists())
+
+    def test_first_read(self):
+        # Tournaments played before the standings table existed have no rows yet.
+        expected = self.get_standings()
+        self.tournament.standing_set.all().delete()
+        players = self.tournament.get_standings().get_players()
+        self.assertEqual(len(players), 6)
+        self.assertEqual(self.get_standings(), expected)
+
+
+@override_settings(MIDDLEWARE_CLASSES=[middleware for middleware in settings.MIDDLEWARE_CLASSES
+                                       if middleware != 'tournament.middleware.ProfilingMiddleware'])
+class QueryBudgetTest(TestCase):
+    """
+    The tournament page and the data it shows are loaded in a fixed number of queries, whatever the tournament size.
+    ProfilingMiddleware is left out, as it re-reads its sample rate from the database every few seconds.
+    """
+    SIZES = (6, 24)
+    ROUNDS = 2
+
+    def setUp(self):
+        cache.clear()
+        self.tournaments = []
+        for players_count in self.SIZES:
+            tournament = create_tournament(players_count, name=u'%d players' % players_count)
+            for i in xrange(self.ROUNDS):
+                play_round(tournament, lambda game: Side.BLACK if game.pk % 3 == 0 else Side.WHITE)
+            self.tournaments.append(Tournament.objects.get(pk=tournament.pk))
+
+    def test_detail_view(self):
+        for tournament in self.tournaments:
+            url = reverse('tournament:tournament_detail', args=[tournament.pk])
+            with self.assertNumQueries(6):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, u'Round %d' % self.ROUNDS)
+            # The cached page costs the query loading the tournament version only.
+            with self.assertNumQueries(1):
+                self.client.get(url)
+
+    def test_list_view(self):
+        # The page of tournaments and their players counts, whatever the number of the older tournaments.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('tournament:tournament_list'))
+        tournaments = dict((tournament.pk, tournament.players_total) for tournament in response.context['tournaments'])
+        for tournament in self.tournaments:
+            self.assertEqual(tournaments[tournament.pk], tournament.players.count())
+
+    def test_rounds(self):
+        for tournament in self.tournaments:
+            with self.assertNumQueries(2):
+                rounds = tournament.get_rounds()
+                games = [(game.white.name, game.black and game.black.name)
+                         for tournament_round in rounds for game in tournament_round.games]
+            self.assertEqual(len(rounds), self.ROUNDS)
+            self.assertEqual(len(games), tournament.get_games().count())
+
+    def test_standings(self):
+        for tournament in self.tournaments:
+            with self.assertNumQueries(1):
+                players = tournament.get_standings().get_players()
+                names = [(player.name, player.score) for player in players]
+            self.assertEqual(len(names), tournament.players.count())
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tournament = create_tournament(4)
+        play_round(self.tournament)
+        self.url = reverse('tournament:tournament_detail', args=[self.tournament.pk])
+
+    def test_cached_response(self):
+        response = self.client.get(self.url)
+        cached = self.client.get(self.url)
+        self.assertEqual(cached.status_code, response.status_code)
+        self.assertEqual(cached['Content-Type'], response['Content-Type'])
+        self.assertEqual(cached.content, response.content)
+
+    def test_player_change(self):
+        Tournament.objects.filter(pk=self.tournament.pk).update(finished=True)
+        self.assertNotContains(self.client.get(self.url), u'Renamed player')
+
+        player = self.tournament.players.all()[0]
+        player.name = u'Renamed player'
+        player.fide_id = 13400000
+        player.save()
+        self.assertContains(self.client.get(self.url), u'Renamed player')
+
+        RatingListImport().run([FideRecord(fide_id=13400000, name=player.name, country='BLR', rating=1234, games=0)])
+        self.assertContains(self.client.get(self.url), u'1234')
+
+
+class ApiTest(TestCase):
+    def test_etag(self):
+        tournament = create_tournament(4)
+        play_round(tournament)
+        url = reverse('tournament:api_standings', args=[tournament.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        player = tournament.players.all()[0]
+        player.name = u'Renamed player'
+        player.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, u'Renamed player')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_empty_standings(self):
+        tournament = create_tournament(0)
+        version = Tournament.objects.get(pk=tournament.pk).version
+        url = reverse('tournament:api_standings', args=[tournament.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(Tournament.objects.get(pk=tournament.pk).version, version)
+
+
+class FideImportTest(TestCase):
+    def test_malformed_records(self):
+        stream = StringIO('''<playerslist>
+            <player><fideid>13400000</fideid><name>Good</name><country>BLR</country><rating>2100</rating></player>
+            <player><name>No id</name><country>BLR</country><rating>2100</rating></player>
+            <player><fideid>13400001</fideid><name>Bad rating</name><rating>-</rating></player>
+        </playerslist>''')
+        self.assertEqual(RatingListImport(create=True).run(parse_xml(stream)), (3, 0, 1, 2))
+        self.assertEqual(list(Player.objects.filter(fide_id__isnull=False).values_list('fide_id', 'rating', 'country')),
+                         [(13400000, 2100, 'BY')])
+
+    def test_repeated_records(self):
+        records = [FideRecord(13400000, u'First', 'BLR', 2100, 10), FideRecord(13400001, u'Second', 'BLR', 2000, 5),
+                   FideRecord(13400000, u'First', 'BLR', 2110, 11), FideRecord(13400001, u'Second', 'BLR', 2010, 6)]
+        # The first player is repeated in the same batch, the second one in the next batch.
+        self.assertEqual(RatingListImport(create=True, batch_size=3).run(records), (4, 1, 2, 0))
+        self.assertEqual(list(Player.objects.filter(fide_id__isnull=False).order_by('fide_id')
+                              .values_list('fide_id', 'rating', 'fide_games')),
+                         [(13400000, 2110, 11), (13400001, 2010, 6)])
+
+
+class ExportTest(TestCase):
+    def test_trf_federations(self):
+        tournament = create_tournament(3)
+        players = list(tournament.players.order_by('-rating'))
+        Player.objects.filter(pk=players[1].pk).update(country='GB')
+        Player.objects.filter(pk=players[2].pk).update(country='AQ')
+        lines = [line for line in export_trf([tournament]) if line.startswith(u'001')]
+        self.assertEqual([line[53:56] for line in lines], [u'BLR', u'ENG', u'   '])
+
+
+class RoundResultsTest(TestCase):
+    def setUp(self):
+        self.tournament = create_tournament(4)
+        self.round = self.tournament.progress(seed=0)
+        self.games = self.round.games
+
+    def get_points(self):
+        return dict(self.tournament.standing_set.values_list('player', 'points'))
+
+    def test_update_results(self):
+        first, second = self.games
+        self.tournament.update_results(self.round, {first.pk: (True, Side.WHITE), second.pk: (True, None)})
+        self.assertEqual(self.get_points(), {first.white_id: 1.0, first.black_id: 0.0, second.white_id: 0.5,
+                                             second.black_id: 0.5})
+        first_deltas = list(Score.objects.filter(game=first).order_by('id').values_list('rating_delta', flat=True))
+
+        # Scores of the unchanged games keep their deltas when the ratings change meanwhile.
+        Player.objects.filter(pk__in=[first.white_id, first.black_id]).update(rating=2400)
+        self.tournament.update_results(self.round, {second.pk: (False, None)})
+        self.assertEqual(list(Score.objects.filter(game=first).order_by('id').values_list('rating_delta', flat=True)),
+                         first_deltas)
+        self.assertFalse(Score.objects.filter(game=second).exists())
+        self.assertEqual(self.get_points(), {first.white_id: 1.0, first.black_id: 0.0, second.white_id: 0.0,
+                                             second.black_id: 0.0})
+        self.assertFalse(self.round.__class__.objects.get(pk=self.round.pk).finished)
+
+        self.tournament.update_results(self.round, {second.pk: (True, Side.BLACK)}, finish_round=True)
+        self.assertTrue(self.round.__class__.objects.get(pk=self.round.pk).finished)
+        self.assertEqual(self.get_points()[second.black_id], 1.0)
+
+    def test_finished_tournament(self):
+        Tournament.objects.filter(pk=self.tournament.pk).update(finished=True)
+        tournament = Tournament.objects.get(pk=self.tournament.pk)
+        self.assertRaises(UserWarning, tournament.update_results, self.round, {self.games[0].pk: (True, None)})
+
+    def get_form(self, results, finish_round=False):
+        payload = {'results': results, 'finish_round': finish_round}
+        return RoundResultsForm(self.games, RoundResultsForm.get_data(self.games, payload))
+
+    def test_form(self):
+        first, second = self.games
+        form = self.get_form({unicode(first.pk): '1-0', unicode(second.pk): '1/2-1/2'}, finish_round=True)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_changes(), {first.pk: (True, Side.WHITE), second.pk: (True, None)})
+
+        form = self.get_form({unicode(first.pk): '0-1'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_changes(), {first.pk: (True, Side.BLACK)})
+
+    def test_form_errors(self):
+        first, second = self.games
+        form = self.get_form({unicode(first.pk): '1-0'}, finish_round=True)
+        self.assertFalse(form.is_valid())
+        self.assertIn('__all__', form.errors)
+
+        form = self.get_form({unicode(first.pk): '2-0'})
+        self.assertFalse(form.is_valid())
+        self.assertIn(RoundResultsForm.get_field_name(first.pk), form.errors)
+
+        self.assertRaises(ValueError, RoundResultsForm.get_data, self.games, {'results': {'0': '1-0'}})
+        self.assertRaises(ValueError, RoundResultsForm.get_data, self.games, {'results': ['1-0']})
+        self.assertRaises(ValueError, RoundResultsForm.get_data, self.games, [])
+
+
+class ProfilingTest(TestCase):
+    def tearDown(self):
+        profiling.set_sample_rate(None)
+
+    def test_sample_rate(self):
+        self.assertEqual(profiling.get_sample_rate(), profiling.DEFAULT_SAMPLE_RATE)
+        profiling.set_sample_rate(0.5)
+        # Other processes read the rate from the database once their copy expires.
+        profiling._sample_rate.update(value=profiling.DEFAULT_SAMPLE_RATE, expires=0)
+        self.assertEqual(profiling.get_sample_rate(), 0.5)
+        profiling.set_sample_rate(None)
+        self.assertEqual(profiling.get_sample_rate(), profiling.DEFAULT_SAMPLE_RATE)
+
+
+class EloTest(TestCase):
+    def test_batch_matches_scalar(self):
+        # An odd number of players, so there is a bye, with a newbie and a player of K-factor 10.
+        tournament = create_tournament(5)
+        players = list(tournament.players.order_by('-rating'))
+        Player.objects.filter(pk=players[0].pk).update(rating=2450)
+        Player.objects.filter(pk=players[-1].pk).update(fide_id=13400000, fide_games=10)
+        current_round = tournament.progress(seed=0)
+        winners = [Side.WHITE, None, Side.BLACK]
+        for (i, game) in enumerate(current_round.game_set.all()):
+            game.finished, game.winner = True, winners[i % len(winners)] if game.black_id is not None else Side.WHITE
+            game.save()
+
+        games = list(current_round.game_set.select_related('white', 'black'))
+        sides = [(game,) + side for game in games for side in game.get_sides()]
+        self.assertIn(None, [opponent for (game, side, player, opponent, score) in sides])
+        self.assertEqual(set(game.get_k(player) for (game, side, player, opponent, score) in sides), set([10, 15, 30]))
+
+        expectations, deltas = get_elo_changes(
+            ratings=[player.rating for (game, side, player, opponent, score) in sides],
+            opponent_ratings=[opponent.rating if opponent is not None else float('nan')
+                              for (game, side, player, opponent, score) in sides],
+            k_factors=[game.get_k(player) for (game, side, player, opponent, score) in sides],
+            scores=[score for (game, side, player, opponent, score) in sides])
+        for ((game, side, player, opponent, score), expectation, delta) in zip(sides, expectations, deltas):
+            self.assertAlmostEqual(expectation, game.get_expectation(player, opponent))
+            self.assertAlmostEqual(delta, game.get_rating_delta(player, opponent, score))
+
+        scores = tournament.score_games(games)
+        self.assertEqual(len(scores), len(sides))
+        for score in scores:
+            opponent = score.game.black if score.side == Side.WHITE else score.game.white
+            self.assertAlmostEqual(score.rating_delta, score.game.get_rating_delta(score.player, opponent, score.score))
+
+
+class ProgressionLogTest(TestCase):
+    def test_phases(self):
+        tournament = create_tournament(4)
+        current_round = tournament.progress(seed=0)
+        phases = ProgressionLog.objects.get(tournament=tournament, round=current_round).get_phases()
+        depths = dict((name, depth) for (name, depth, seconds, queries, query_seconds) in phases)
+        # The commit is reported apart from the inserts of the round and its games.
+        self.assertEqual(depths['commit'], depths['persistence'] + 1)
+        self.assertEqual([name for (name, depth, seconds, queries, query_seconds) in phases][-2:],
+                         ['persistence', 'commit'])
+
+
+class ReplayTest(TestCase):
+    def setUp(self):
+        # The players of the first tournament play the second one as well, along with a new player.
+        self.first = create_tournament(4, name=u'First')
+        self.second = create_tournament(1, name=u'Second')
+        self.second.players.add(*self.first.players.all())
+        for tournament in (self.first, self.second):
+            play_round(tournament)
+            tournament.finish_tournament()
+
+    def get_ratings(self):
+        return dict(self.second.players.values_list('id', 'rating'))
+
+    def get_changes(self):
+        return sorted(RatingChange.objects.values_list('tournament', 'player', 'rating_before', 'rating_after'))
+
+    def test_replay(self):
+        ratings, changes = self.get_ratings(), self.get_changes()
+        self.assertEqual(RatingReplay().run(), 2)
+        self.assertEqual(self.get_ratings(), ratings)
+        self.assertEqual(self.get_changes(), changes)
+
+    def test_since(self):
+        RatingReplay(checkpoint_interval=1).run()
+        # A change made outside of the tournaments after the checkpoint, like the FIDE rating list import, of the
+        # player who has not played the first tournament, so the full replay gives the same ratings.
+        player = self.second.players.exclude(tournament=self.first)[0]
+        Player.objects.filter(pk=player.pk).update(rating=models.F('rating') + 50)
+
+        self.assertEqual(RatingReplay(checkpoint_interval=1).run(since=self.second.pk), 1)
+        ratings = self.get_ratings()
+        # The change is kept, the second tournament is replayed with it.
+        self.assertGreater(ratings[player.pk], player.rating + 40)
+        self.assertEqual(RatingReplay().run(), 2)
+        self.assertEqual(self.get_ratings(), ratings)
+
+    def test_resume(self):
+        # The result of a game of the first tournament is corrected, so its players ratings are replayed differently.
+        game = self.first.get_games().exclude(black=None).order_by('id')[0]
+        change = RatingChange.objects.get(tournament=self.first, player=game.white_id).rating_delta()
+        Score.objects.filter(game=game, player=game.white_id).update(score=0.0)
+        Score.objects.filter(game=game, player=game.black_id).update(score=1.0)
+
+        def fail(tournament_id, replayed, total):
+            raise RuntimeError('Interrupted')
+
+        self.assertRaises(RuntimeError, RatingReplay(checkpoint_interval=1, callback=fail).run)
+        self.assertEqual(RatingReplay(checkpoint_interval=1).run(resume=True), 1)
+        self.assertNotEqual(RatingChange.objects.get(tournament=self.first, player=game.white_id).rating_delta(),
+                            change)
+        # Resuming the interrupted replay gives the same ratings as replaying everything.
+        ratings, changes = self.get_ratings(), self.get_changes()
+        self.assertEqual(RatingReplay().run(), 2)
+        self.assertEqual(self.get_ratings(), ratings)
+        self.assertEqual(self.get_changes(), changes)
+
+
+class JobsTest(TestCase):
+    def setUp(self):
+        self.tournament = create_tournament(4)
+
+    def claim(self):
+        ProgressionJob.objects.create(tournament=self.tournament, lock=self.tournament.pk,
+                                      rounds_count=self.tournament.round_set.count())
+        return jobs.claim_next()
+
+    def test_submit(self):
+        worker, jobs.WORKER = jobs.WORKER, jobs.Workers.COMMAND
+        try:
+            self.tournament.progress()
+            job = jobs.submit(self.tournament)
+            self.assertEqual(jobs.submit(self.tournament), job)
+        finally:
+            jobs.WORKER = worker
+        self.assertEqual(job.rounds_count, 1)
+
+    def test_run(self):
+        job = self.claim()
+        jobs.run(job)
+        job = ProgressionJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, JobStatuses.DONE)
+        self.assertIsNone(job.lock)
+        self.assertEqual(job.round, self.tournament.round_set.get())
+
+    def test_stale(self):
+        job = self.claim()
+        ProgressionJob.objects.filter(pk=job.pk).update(
+            started=timezone.now() - timedelta(seconds=jobs.JOB_TIMEOUT + 1))
+        jobs.fail_stale()
+        # The job submitted afterwards starts the round, so the stale one fails to start it again and doesn't
+        # overwrite its failure when finishing late.
+        jobs.run(self.claim())
+        jobs.run(job)
+        self.assertEqual(ProgressionJob.objects.get(pk=job.pk).status, JobStatuses.FAILED)
+        self.assertEqual(self.tournament.round_set.count(), 1)
+
+    def test_round_started_meanwhile(self):
+        rounds_count = self.tournament.round_set.count()
+        self.tournament.progress()
+        self.assertRaises(UserWarning, self.tournament.progress, rounds_count=rounds_count)
+        self.assertRaises(UserWarning, self.tournament.start_next_round, u'Round', rounds_count=rounds_count)
+        self.assertEqual(self.tournament.round_set.count(), 1)
+
+    def test_finish_twice(self):
+        play_round(self.tournament)
+        tournament = Tournament.objects.get(pk=self.tournament.pk)
+        self.tournament.finish_tournament()
+        ratings = dict(self.tournament.players.values_list('id', 'rating'))
+        self.assertRaises(UserWarning, tournament.finish_tournament)
+        self.assertEqual(dict(self.tournament.players.values_list('id', 'rating')), ratings)
+
+
+def create_state(players_count, scores=None, played=()):
+    """
+    Creates the state of the players with ids from 1 up, rated from 2000 down in steps of 10.
+    :rtype: TournamentState
+    """
+    ids = range(1, players_count + 1)
+    return TournamentState(ids, scores or [0.0] * players_count, [2000 - 10 * i for i in xrange(players_count)],
+                           played)
+
+
+def play_rounds(engine_class, players_count, rounds, seed=0):
+    """
+    Pairs the rounds of random results without the database.
+    :returns: the state and the (white id, black id) pairs of every round
+    :rtype: tuple
+    """
+    rng = random.Random(seed)
+    state = create_state(players_count)
+    history = []
+    for i in xrange(rounds):
+        pairs = engine_class(state, random.Random(seed + i)).pair()
+        for (white, black) in pairs:
+            state.add_game(white, black)
+            if black is None:
+                state.scores[state.indexes[white]] += 1
+            else:
+                result = rng.choice((1.0, 0.5, 0.0))
+                state.scores[state.indexes[white]] += result
+                state.scores[state.indexes[black]] += 1 - result
+        history.append(pairs)
+    return state, history
+
+
+def brute_force_matching(vertices, edges):
+    """
+    Returns (cardinality, weight) of the maximum weight matching of maximum cardinality, found by trying them all.
+    :param edges: dict of the weights by (i, j) vertex pairs, i < j
+    :type edges: dict
+    :rtype: tuple
+    """
+    if len(vertices) < 2:
+        return 0, 0
+    first, rest = vertices[0], vertices[1:]
+    best = brute_force_matching(rest, edges)
+    for vertex in rest:
+        if (first, vertex) in edges:
+            cardinality, weight = brute_force_matching([v for v in rest if v != vertex], edges)
+            best = max(best, (cardinality + 1, weight + edges[(first, vertex)]))
+    return best
+
+
+class PairingTest(SimpleTestCase):
+    ENGINES = (SwissPairing, MatchingPairing)
+
+    def test_no_rematches(self):
+        for engine_class in self.ENGINES:
+            for players_count in (8, 9, 16, 17):
+                state, history = play_rounds(engine_class, players_count, 4)
+                games = [frozenset(pair) for pair in itertools.chain.from_iterable(history) if None not in pair]
+                self.assertEqual(len(games), len(set(games)), (engine_class.__name__, players_count))
+
+    def test_byes(self):
+        for engine_class in self.ENGINES:
+            state = create_state(5, scores=[1.0] * 5, played=[(5, None)])
+            pairs = engine_class(state).pair()
+            self.assertEqual([white for (white, black) in pairs if black is None], [4], engine_class.__name__)
+
+            state = create_state(7)
+            rng = random.Random(0)
+            for i in xrange(4):
+                order = [state.get_id(player) for player in SwissPairing(state).sort()]
+                expected = [player for player in order if (player, None) not in state.played][-1]
+                pairs = engine_class(state, random.Random(i)).pair()
+                self.assertEqual([white for (white, black) in pairs if black is None], [expected],
+                                 engine_class.__name__)
+                for (white, black) in pairs:
+                    state.add_game(white, black)
+                    result = rng.choice((1.0, 0.5, 0.0)) if black is not None else 1.0
+                    state.scores[state.indexes[white]] += result
+                    if black is not None:
+                        state.scores[state.indexes[black]] += 1 - result
+
+    def test_one_bye_per_round(self):
+        # Random results, for some rounds of which pairing within the score groups leaves players without opponents.
+        for engine_class in self.ENGINES:
+            for players_count in (5, 7, 8, 9, 11, 16, 17):
+                for seed in xrange(5):
+                    history = play_rounds(engine_class, players_count, min(players_count / 2 + 1, 5), seed=seed)[1]
+                    self.assertEqual([sum(1 for (white, black) in pairs if black is None) for pairs in history],
+                                     [players_count % 2] * len(history), (engine_class.__name__, players_count, seed))
+
+    def test_same_seed_same_colors(self):
+        for engine_class in self.ENGINES:
+            self.assertEqual(play_rounds(engine_class, 16, 3, seed=7)[1], play_rounds(engine_class, 16, 3, seed=7)[1],
+                             engine_class.__name__)
+
+    def test_matching_weight(self):
+        rng = random.Random(0)
+        for attempt in xrange(100):
+            vertices = range(rng.randint(0, 8))
+            edges = dict(((i, j), rng.randint(1, 20)) for (i, j) in itertools.combinations(vertices, 2)
+                         if rng.random() < 0.6)
+            mates = max_weight_matching([(i, j, weight) for ((i, j), weight) in edges.iteritems()],
+                                        maxcardinality=True)
+            matched = [(i, mate) for (i, mate) in enumerate(mates) if mate > i]
+            self.assertEqual((len(matched), sum(edges[pair] for pair in matched)),
+                             brute_force_matching(vertices, edges), edges)
+
+    def test_matching_pairing(self):
+        for seed in xrange(20):
+            state = play_rounds(MatchingPairing, random.Random(seed).randint(2, 9), 2, seed=seed)[0]
+            engine = MatchingPairing(state)
+            order = engine.sort()
+            halves = dict((player, len(group) / 2) for group in engine.group() for player in group)
+            bye = len(order)
+            available = [(i, j) for (i, j) in itertools.combinations(xrange(len(order)), 2)
+                         if not state.has_played(order[i], order[j])]
+            if len(order) % 2 != 0:
+                available.extend((i, bye) for i in xrange(len(order)) if not state.has_played(order[i], None))
+            played = set(state.played.keys)
+
+            # A single block is paired, the same way pair_indexes does it.
+            pairs = engine.pair_indexes()
+            state.played.keys = played
+            block_pairs, unpaired = engine.pair_block(order, halves, with_bye=True)
+            self.assertEqual(pairs, block_pairs + [(player, None) for player in unpaired], seed)
+
+            get_weight = lambda i, j: engine.get_bye_weight(order, i) if j == bye \
+                else engine.get_weight(order, halves, i, j)
+            positions = dict((player, i) for (i, player) in enumerate(order))
+            positions[None] = bye
+            weight = sum(get_weight(*sorted((positions[player], positions[opponent])))
+                         for (player, opponent) in block_pairs)
+            weights = dict((pair, get_weight(*pair)) for pair in available)
+            self.assertEqual((len(block_pairs), weight), brute_force_matching(range(len(order) + 1), weights), seed)
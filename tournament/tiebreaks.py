@@ -0,0 +1,123 @@
+# -*- encoding: utf-8 -*-
+import numpy
+
+
+def bincount(values, count, weights=None):
+    """
+    numpy.bincount of at least `count` bins, which also accepts empty values: NumPy before 1.8 raises ValueError
+    for them, as for a tournament without results yet.
+    :type values: numpy.ndarray
+    :type count: int
+    :type weights: numpy.ndarray
+    :rtype: numpy.ndarray
+    """
+    if not len(values):
+        return numpy.zeros(count, dtype=numpy.float64 if weights is not None else numpy.int64)
+    return numpy.bincount(values, weights=weights, minlength=count)
+
+
+class Tiebreaks(object):
+    """
+    Tiebreak scores of the tournament players, computed at once over arrays of the tournament results.
+    Byes count for the player's score, but not for the opponent based tiebreaks.
+    """
+    BUCHHOLZ = 'buchholz'
+    MEDIAN_BUCHHOLZ = 'median_buchholz'
+    SONNEBORN_BERGER = 'sonneborn_berger'
+    PROGRESSIVE = 'progressive'
+    DIRECT_ENCOUNTER = 'direct_encounter'
+
+    # Order the tiebreaks are applied in to the players with equal scores.
+    ORDER = (BUCHHOLZ, MEDIAN_BUCHHOLZ, SONNEBORN_BERGER, PROGRESSIVE, DIRECT_ENCOUNTER)
+
+    def __init__(self, ids, results):
+        """
+        :param ids: player ids
+        :type ids: Iterable
+        :param results: (round id, player id, opponent id, score) tuples of every side of every game, ordered by
+        round. Opponent id is None for bye
+        :type results: Iterable
+        """
+        self.indexes = dict((player_id, i) for (i, player_id) in enumerate(ids))
+        rounds, players, opponents, scores = [], [], [], []
+        for (round_id, player_id, opponent_id, score) in results:
+            rounds.append(round_id)
+            players.append(self.get_index(player_id))
+            opponents.append(self.get_index(opponent_id) if opponent_id is not None else -1)
+            scores.append(score)
+
+        self.values = self.compute(len(self.indexes),
+                                   numpy.asarray(rounds, dtype=numpy.int64),
+                                   numpy.asarray(players, dtype=numpy.int64),
+                                   numpy.asarray(opponents, dtype=numpy.int64),
+                                   numpy.asarray(scores, dtype=numpy.float64))
+
+    def get_index(self, player_id):
+        # Players removed from the tournament after playing in it still count as opponents.
+        return self.indexes.setdefault(player_id, len(self.indexes))
+
+    def compute(self, count, rounds, players, opponents, scores):
+        """
+        :returns: dict of { tiebreak name: array of the tiebreak values by player index }
+        :rtype: dict
+        """
+        points = bincount(players, count, weights=scores)
+
+        played = opponents >= 0
+        players_played, opponents_played = players[played], opponents[played]
+        opponent_points = points[opponents_played]
+        buchholz = bincount(players_played, count, weights=opponent_points)
+        sonneborn_berger = bincount(players_played, count, weights=scores[played] * opponent_points)
+
+        # Median Buchholz drops the best and the worst opponents of the players having more than two of them.
+        # Opponents of each player are sorted by their points, so the first is the worst one and the last is the best.
+        opponents_counts = bincount(players_played, count)
+        best, worst = numpy.zeros(count), numpy.zeros(count)
+        order = numpy.lexsort((opponent_points, players_played))
+        sorted_players, sorted_points = players_played[order], opponent_points[order]
+        firsts = numpy.flatnonzero(numpy.diff(numpy.concatenate(([-1], sorted_players))))
+        lasts = numpy.flatnonzero(numpy.diff(numpy.concatenate((sorted_players, [-1]))))
+        worst[sorted_players[firsts]] = sorted_points[firsts]
+        best[sorted_players[lasts]] = sorted_points[lasts]
+        median_buchholz = numpy.where(opponents_counts > 2, buchholz - best - worst, buchholz)
+
+        # Progressive score sums the running scores after each round: the score of the i-th of the player's m
+        # games counts m - i times.
+        order = numpy.lexsort((rounds, players))
+        sorted_players = players[order]
+        games_counts = bincount(players, count)
+        first_games = numpy.cumsum(games_counts) - games_counts
+        positions = numpy.arange(len(order)) - first_games[sorted_players]
+        progressive = bincount(sorted_players, count,
+                               weights=scores[order] * (games_counts[sorted_players] - positions))
+
+        # Direct encounter is the score gained against the opponents with the same score.
+        tied = numpy.zeros(len(players), dtype=bool)
+        tied[played] = points[players_played] == opponent_points
+        direct_encounter = bincount(players[tied], count, weights=scores[tied])
+
+        return {
+            self.BUCHHOLZ: buchholz,
+            self.MEDIAN_BUCHHOLZ: median_buchholz,
+            self.SONNEBORN_BERGER: sonneborn_berger,
+            self.PROGRESSIVE: progressive,
+            self.DIRECT_ENCOUNTER: direct_encounter,
+        }
+
+    def get(self, player_id):
+        """
+        Returns tiebreaks of the player.
+        :returns: dict of { tiebreak name: value }
+        :rtype: dict
+        """
+        index = self.indexes.get(player_id)
+        return dict((name, float(values[index]) if index is not None else 0.0)
+                    for (name, values) in self.values.iteritems())
+
+    def get_key(self, player_id):
+        """
+        Returns tiebreaks of the player in the order they are applied, for use as a secondary sort key.
+        :rtype: tuple
+        """
+        index = self.indexes.get(player_id)
+        return tuple(float(self.values[name][index]) if index is not None else 0.0 for name in self.ORDER)
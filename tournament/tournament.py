@@ -1,27 +1,114 @@
 # -*- encoding: utf-8 -*-
 from datetime import datetime
 import itertools
+import logging
 import math
 import operator
 import random
 
-from django.db import models
-
-from .models import Side, Scores
+from django.db import connection, models, transaction
+import numpy
+
+from .models import Pairings, Side, Scores
+from .pairing import MatchingPairing, SwissPairing, TournamentState
+from .profiling import Profile
+from .tiebreaks import Tiebreaks
+
+logger = logging.getLogger(__name__)
+
+
+def chunked(items, size):
+    """
+    Splits the items into lists of the given size at most.
+    :type items: Iterable
+    :type size: int
+    :rtype: Iterable
+    """
+    items = iter(items)
+    return iter(lambda: list(itertools.islice(items, size)), [])
+
+
+def update_column(model, column, rows, batch_size=500):
+    """
+    Updates the column of the model rows with a single statement executed for many parameters.
+    :param rows: list of (value, pk) tuples
+    :type rows: list
+    """
+    update_columns(model, (column,), rows, batch_size)
+
+
+def update_columns(model, columns, rows, batch_size=500):
+    """
+    Updates the columns of the model rows with a single statement executed for many parameters.
+    :param columns: column names
+    :type columns: Iterable
+    :param rows: list of (value, ..., pk) tuples, values are in the same order as columns
+    :type rows: list
+    """
+    quote_name = connection.ops.quote_name
+    sql = 'UPDATE %s SET %s WHERE %s = %%s' % (quote_name(model._meta.db_table),
+                                               ', '.join('%s = %%s' % quote_name(column) for column in columns),
+                                               quote_name(model._meta.pk.column))
+    cursor = connection.cursor()
+    for batch in chunked(rows, batch_size):
+        cursor.executemany(sql, batch)
+
+
+def get_elo_changes(ratings, opponent_ratings, k_factors, scores):
+    """
+    Computes Elo expectations and rating deltas of a batch of games at once.
+    :param ratings: player ratings
+    :type ratings: Iterable
+    :param opponent_ratings: opponent ratings, in the same order as ratings. NaN for bye
+    :type opponent_ratings: Iterable
+    :param k_factors: player K-factors, in the same order as ratings
+    :type k_factors: Iterable
+    :param scores: player scores, in the same order as ratings
+    :type scores: Iterable
+    :returns: (expectations, rating deltas) arrays
+    :rtype: tuple
+    """
+    ratings = numpy.asarray(ratings, dtype=numpy.float64)
+    opponent_ratings = numpy.asarray(opponent_ratings, dtype=numpy.float64)
+
+    expectations = 1.0 / (1.0 + 10.0 ** ((opponent_ratings - ratings) / 400.0))
+    expectations[numpy.isnan(opponent_ratings)] = 1.0
+    deltas = numpy.asarray(k_factors, dtype=numpy.float64) * (numpy.asarray(scores, dtype=numpy.float64) - expectations)
+    return expectations, deltas
 
 
 class EloRatingMixin(object):
     def update_scores(self):
-        for score in self.score_set.all():
-            score.delete()
-        if self.white is not None:
-            self.score_set.create(player=self.white, side=Side.WHITE, score=self.get_side_score(Side.WHITE),
-                                  rating_delta=self.get_rating_delta(self.white, self.black,
-                                                                     self.get_side_score(Side.WHITE)))
-        if self.black is not None:
-            self.score_set.create(player=self.black, side=Side.BLACK, score=self.get_side_score(Side.BLACK),
-                                  rating_delta=self.get_rating_delta(self.black, self.white,
-                                                                     self.get_side_score(Side.BLACK)))
+        """
+        Rebuilds the scores of this game, or removes them if it is not finished, and updates the standings of its
+        players. The players are re-ranked by whoever saves the games, once all of them are saved.
+        """
+        if not self.finished and not self.score_set.exists():
+            return
+        with transaction.commit_on_success():
+            self.score_set.all().delete()
+            if self.finished:
+                self.score_set.model.objects.bulk_create(self.build_scores())
+            self.round.tournament.update_standings([self.white_id, self.black_id], rank=False)
+
+    def build_scores(self):
+        """
+        Returns unsaved scores of both sides of this game.
+        :rtype: list
+        """
+        return [self.score_set.model(game=self, player=player, side=side, score=score,
+                                     rating_delta=self.get_rating_delta(player, opponent, score))
+                for (side, player, opponent, score) in self.get_sides()]
+
+    def get_sides(self):
+        """
+        Returns (side, player, opponent, score) tuples of the players of this game.
+        :rtype: list
+        """
+        return [(side, player, opponent, self.get_side_score(side))
+                for (side, player, opponent) in ((Side.WHITE, self.white, self.black),
+                                                 (Side.BLACK, self.black, self.white))
+                if player is not None]
 
     def get_side_score(self, side):
         if self.winner == side:
@@ -43,189 +130,524 @@ class EloRatingMixin(object):
             return 15
 
     def get_expectation(self, player, opponent):
-        return 1 / (1 + 10 ** ((opponent.rating or 0.0 - player.rating) / 400)) if opponent is not None else 1.0
+        return 1.0 / (1 + 10 ** ((opponent.rating - player.rating) / 400.0)) if opponent is not None else 1.0
+
+
+class Standings(object):
+    """
+    Snapshot of the tournament standings, loaded from the standings table with a single indexed query. The table is
+    maintained by the writes, so reading it only writes once: standings of the tournaments played before it existed
+    are built on their first read, unless `manage.py update_standings` has built them already.
+    """
+
+    def __init__(self, tournament):
+        """
+        :param tournament: tournament to take the snapshot of
+        :type tournament: Tournament
+        """
+        self.rows = self.load(tournament)
+        if not self.rows and tournament.players.exists():
+            tournament.update_standings()
+            self.rows = self.load(tournament)
+
+        self.scores = dict((standing.player_id, standing.points) for standing in self.rows)
+        self.ranks = dict((standing.player_id, standing.rank) for standing in self.rows)
+        self.started = any(standing.games_played for standing in self.rows)
+
+    @staticmethod
+    def load(tournament):
+        return list(tournament.standing_set.select_related('player').order_by('rank'))
+
+    def get_rank(self, player):
+        return self.ranks.get(player.pk) or len(self.ranks) + 1
+
+    def get_players(self, tiebreaks=None):
+        """
+        Returns players in the standings order, with their tournament score set as `score` attribute.
+        :param tiebreaks: tiebreaks of the players. If given - players have them set as `tiebreaks` attribute
+        :type tiebreaks: Tiebreaks
+        :rtype: list
+        """
+        players = []
+        for standing in self.rows:
+            standing.player.score = standing.points
+            if tiebreaks is not None:
+                standing.player.tiebreaks = tiebreaks.get(standing.player_id)
+            players.append(standing.player)
+        return players
+
+    def sort(self, players):
+        """
+        Sorts the players by their rating in the first round and by their rank in all the following ones, which
+        orders equal scores by the tiebreaks.
+        :param players: players iterable
+        :type players: Iterable
+        :rtype: list
+        """
+        if not self.started:
+            return sorted(players, reverse=True, key=operator.attrgetter('rating'))
+        return sorted(players, key=self.get_rank)
 
 
 class SwissSystemMixin(object):
-    def progress(self, next_round_name=None):
-        self.finish_current_round()
+    UPDATE_BATCH_SIZE = 500
 
-        if self.round_set.count() < self.max_round_count():
-            self.start_next_round(next_round_name)
-        else:
-            self.finish_tournament()
+    def progress(self, next_round_name=None, seed=None, rounds_count=None):
+        """
+        Finishes current round and starts the next one, or finishes the tournament after the last round.
+        Time and queries of every phase are logged and recorded as ProgressionLog.
+        :param rounds_count: number of the rounds the tournament is expected to have. If given - the progression is
+        refused once a round is started by another one
+        :type rounds_count: int
+        :returns: started round, None if the tournament is finished
+        :rtype: Round
+        """
+        self.check_rounds_count(rounds_count)
+        profile = Profile()
+        with profile.phase('progress') as total:
+            with profile.phase('finish_current_round'):
+                self.finish_current_round(profile)
+
+            if self.round_set.count() < self.max_round_count():
+                next_round = self.start_next_round(next_round_name, seed, profile, rounds_count)
+            else:
+                next_round = None
+                with profile.phase('finish_tournament'):
+                    self.finish_tournament(profile)
+
+        self.log_progression(profile, total, next_round)
+        return next_round
+
+    def log_progression(self, profile, total, next_round=None):
+        """
+        Logs cost of the progress() and records it as ProgressionLog.
+        :param profile: phases of the progress()
+        :type profile: Profile
+        :param total: the phase of the whole progress()
+        :type total: Phase
+        :param next_round: started round, None if the tournament is finished
+        :type next_round: Round
+        :rtype: ProgressionLog
+        """
+        from .models import ProgressionLog
+
+        outcome = profile.outcome
+        log = ProgressionLog(tournament=self, round=next_round, players=outcome.get('players', 0),
+                             games=outcome.get('games', 0), byes=outcome.get('byes', 0),
+                             floaters=outcome.get('floaters', 0), seconds=total.seconds, queries=total.queries,
+                             query_seconds=total.query_seconds)
+        log.set_phases(profile.as_list())
+        log.save()
+
+        logger.info(u'"%s" progressed to "%s" in %.3fs, %d queries in %.3fs: %s', self,
+                    next_round if next_round is not None else u'the end', total.seconds, total.queries,
+                    total.query_seconds, u', '.join(u'%s %.3fs/%dq' % (name, seconds, queries)
+                                                     for (name, depth, seconds, queries, query_seconds)
+                                                     in log.get_phases()[1:]),
+                    extra={'progression': dict(outcome, phases=log.get_phases(), tournament=self.pk)})
+        return log
+
+    def check_rounds_count(self, rounds_count):
+        """
+        :param rounds_count: expected number of the rounds, None to skip the check
+        :type rounds_count: int
+        """
+        if rounds_count is not None and self.round_set.count() != rounds_count:
+            raise UserWarning(u'A round of "%s" was started by another progression meanwhile' % self)
 
     def max_round_count(self):
         return round(math.log(self.players.count(), 2)) + round(math.log(self.players.count(), 2))
 
-    def finish_tournament(self):
-        self.update_ratings()
+    def finish_tournament(self, profile=None):
+        """
+        :param profile: profile to record the phases to
+        :type profile: Profile
+        """
+        profile = profile or Profile()
+        end_date = datetime.now()
+        with transaction.commit_on_success():
+            # The tournament is marked as finished first and by a conditional update, so of the concurrent
+            # progressions only one applies the ratings.
+            if not type(self).objects.filter(pk=self.pk, finished=False).update(finished=True, end_date=end_date):
+                raise UserWarning(u'The tournament "%s" is already finished' % self)
+            with profile.phase('ratings'):
+                changes = self.update_ratings()
+        with profile.phase('snapshots'):
+            self.take_rating_snapshots(ratings=dict((change.player_id, change.rating_after) for change in changes))
+        profile.outcome = {'players': len(changes)}
         self.finished = True
-        self.end_date = datetime.now()
-        self.save()
+        self.end_date = end_date
+        # Saved again for the receivers of the change, which invalidate the cached pages.
+        self.save(update_fields=('finished', 'end_date'))
 
-    def finish_current_round(self):
+    def finish_current_round(self, profile=None):
+        """
+        :param profile: profile to record the phases to
+        :type profile: Profile
+        """
         if self.finished:
             raise UserWarning(u'The tournament "%s" is already finished' % self)
         if self.get_started_games().count() != 0:
             raise UserWarning(u'Some games are not finished yet')
 
+        profile = profile or Profile()
         current_round = self.get_latest_round()
         if current_round is not None:
-            self.update_round_scores(current_round)
+            with profile.phase('scores'):
+                self.update_round_scores(current_round)
+            with profile.phase('snapshots'):
+                self.take_rating_snapshots(current_round)
 
     def update_round_scores(self, current_round):
         """
         :param current_round: currently latest Round
         :type current_round: Round
         """
+        from .models import Score
+
         if not current_round.finished:
             raise UserWarning(u'"%s" is not finished yet' % current_round)
 
-        for game in current_round.game_set.all():
-            game.update_scores()
+        scores = self.score_games(current_round.game_set.select_related('white', 'black'))
+        with transaction.commit_on_success():
+            Score.objects.filter(game__round=current_round).delete()
+            Score.objects.bulk_create(scores)
+            self.update_standings()
 
-    def start_next_round(self, next_round_name):
+    def score_games(self, games):
+        """
+        Returns unsaved scores of both sides of the games, with the rating deltas of all of them computed at once.
+        :param games: games with their players selected
+        :type games: Iterable
+        :rtype: list
+        """
+        from .models import Score
+
+        sides = [(game,) + side for game in games for side in game.get_sides()]
+        expectations, deltas = get_elo_changes(
+            ratings=[player.rating for (game, side, player, opponent, score) in sides],
+            opponent_ratings=[opponent.rating if opponent is not None else numpy.nan
+                              for (game, side, player, opponent, score) in sides],
+            k_factors=[game.get_k(player) for (game, side, player, opponent, score) in sides],
+            scores=[score for (game, side, player, opponent, score) in sides])
+        return [Score(game=game, player=player, side=side, score=score, rating_delta=float(delta))
+                for ((game, side, player, opponent, score), delta) in itertools.izip(sides, deltas)]
+
+    def update_results(self, current_round, results, finish_round=False):
+        """
+        Records results of many games of the round at once: the games are updated with a statement per distinct
+        result, and the scores of the changed games and the standings of their players are rebuilt, all in a single
+        transaction.
+        :param current_round: round of this tournament the games are played in
+        :type current_round: Round
+        :param results: dict of { game id: (finished, winner) } of the changed games
+        :type results: dict
+        :param finish_round: whether to mark the round as finished as well
+        :type finish_round: bool
+        """
+        from .models import Score
+
+        if self.finished:
+            raise UserWarning(u'The tournament "%s" is already finished' % self)
+
+        end_date = datetime.now()
+        updates = itertools.groupby(sorted(results.iteritems(), key=operator.itemgetter(1)), operator.itemgetter(1))
+        with transaction.commit_on_success():
+            for ((finished, winner), group) in updates:
+                for game_ids in chunked((game_id for (game_id, result) in group), self.UPDATE_BATCH_SIZE):
+                    current_round.game_set.filter(pk__in=game_ids).update(
+                        finished=finished, winner=winner, end_date=end_date if finished else None)
+
+            # Rating deltas are computed from the current player ratings, which may have changed since the other
+            # games were scored, so only the changed games are rescored.
+            player_ids = set()
+            for game_ids in chunked(results, self.UPDATE_BATCH_SIZE):
+                games = list(current_round.game_set.filter(pk__in=game_ids).select_related('white', 'black'))
+                Score.objects.filter(game__in=[game.pk for game in games]).delete()
+                Score.objects.bulk_create(self.score_games(game for game in games if game.finished))
+                player_ids.update(itertools.chain.from_iterable((game.white_id, game.black_id) for game in games))
+            if finish_round and not current_round.finished:
+                current_round.finished = True
+                current_round.end_date = end_date
+                current_round.save()
+            self.update_standings(player_ids)
+
+    def start_next_round(self, next_round_name, seed=None, profile=None, rounds_count=None):
         """
         :param next_round_name: next round name
         :type next_round_name: basestring
+        :param seed: seed of the random numbers generator used to resolve colors
+        :type seed: int
+        :param profile: profile to record the phases to. The players and games counts, byes and floaters of the
+        pairing are set to it as `outcome` dict
+        :type profile: Profile
+        :param rounds_count: number of the rounds the tournament is expected to have, checked again before the round
+        is created
+        :type rounds_count: int
+        :returns: created round, its games are available as `games` attribute
+        :rtype: Round
         """
+        from .models import Game
+
+        profile = profile or Profile()
         if next_round_name is None:
             next_round_name = u'Round %s' % str(self.round_set.count() + 1)
 
-        next_round = self.round_set.create(name=next_round_name, start_date=datetime.now())
-        for pair in self.pair_players():
-            next_round.game_set.create(start_date=datetime.now(), **self.map_colors(pair))
-
-    def update_ratings(self):
+        with profile.phase('standings'):
+            standings = self.get_standings()
+        with profile.phase('state'):
+            state = self.get_pairing_state(standings)
+        engine = self.get_pairing_engine(state, seed)
+        with profile.phase('pairing'):
+            index_pairs = engine.pair_indexes()
+        with profile.phase('colors'):
+            pairs = engine.resolve_colors(index_pairs)
+        byes, floaters = engine.get_outcome(index_pairs)
+        profile.outcome = {'players': len(state), 'games': len(pairs), 'byes': byes, 'floaters': floaters}
+
+        # The round and all its games are written at once, so a failure never leaves a partially paired round. The
+        # transaction is committed by hand, so the cost of the commit is reported as a phase of its own.
+        with profile.phase('persistence'):
+            with transaction.commit_manually():
+                try:
+                    # The tournament row is locked, so concurrent progressions check the rounds count one at a time.
+                    list(type(self).objects.select_for_update().filter(pk=self.pk).values_list('id', flat=True))
+                    self.check_rounds_count(rounds_count)
+                    next_round = self.round_set.create(name=next_round_name, start_date=datetime.now())
+                    start_date = datetime.now()
+                    Game.objects.bulk_create([Game(round=next_round, start_date=start_date, white_id=white,
+                                                   black_id=black) for (white, black) in pairs])
+                except Exception:
+                    transaction.rollback()
+                    raise
+                with profile.phase('commit'):
+                    transaction.commit()
+            next_round.games = list(next_round.game_set.all())
+        return next_round
+
+    def take_rating_snapshots(self, current_round=None, ratings=None):
         """
-        Updates players ratings based on this tournament resulting scores.
+        Records players ratings after the round: the ratings they had before the tournament with rating deltas of
+        the tournament so far.
+        :param current_round: the round just finished. If missing - final tournament ratings are recorded
+        :type current_round: Round
+        :param ratings: dict of { player id: rating }. If missing - will be computed from the tournament scores
+        :type ratings: dict
         """
-        for player in self.players.all():
-            player.rating += self.get_player_scores(player).aggregate(models.Sum('rating_delta'))
-            player.save()
+        from .models import RatingSnapshot
+
+        if ratings is None:
+            deltas = dict(self.standing_set.values_list('player', 'rating_delta'))
+            ratings = dict((player_id, rating + int(round(deltas.get(player_id) or 0.0)))
+                           for (player_id, rating) in self.players.values_list('id', 'rating'))
 
-    def pair_players(self):
+        date = datetime.now()
+        with transaction.commit_on_success():
+            RatingSnapshot.objects.filter(tournament=self, round=current_round).delete()
+            RatingSnapshot.objects.bulk_create([
+                RatingSnapshot(player_id=player_id, tournament=self, round=current_round, date=date, rating=rating)
+                for (player_id, rating) in ratings.iteritems()])
+
+    def update_ratings(self):
         """
-        Returns list of player pairs.
-        :returns: list of player pairs
+        Updates players ratings based on this tournament resulting scores and records the rating changes.
+        :returns: list of rating changes
         :rtype: list
         """
-        return list(itertools.chain.from_iterable(map(self.pair_players_group,
-                                                      self.normalize_groups(self.group_players()))))
-
-    def normalize_groups(self, groups):
+        from .models import Player, RatingChange, Tournament
+
+        deltas = dict(self.standing_set.values_list('player', 'rating_delta'))
+        changes = [RatingChange(tournament=self, player_id=player_id, rating_before=rating,
+                                rating_after=rating + int(round(deltas.get(player_id) or 0.0)))
+                   for (player_id, rating) in self.players.values_list('id', 'rating')]
+
+        # Players are updated in groups by rating delta, which are few regardless of the players count.
+        updates = itertools.groupby(sorted(changes, key=RatingChange.rating_delta), RatingChange.rating_delta)
+        with transaction.commit_on_success():
+            RatingChange.objects.filter(tournament=self).delete()
+            RatingChange.objects.bulk_create(changes)
+            for (delta, group) in updates:
+                if delta == 0:
+                    continue
+                for player_ids in chunked((change.player_id for change in group), self.UPDATE_BATCH_SIZE):
+                    Player.objects.filter(pk__in=player_ids).update(rating=models.F('rating') + delta)
+            # Pages of the other tournaments of the players show their ratings too.
+            Tournament.touch_players([change.player_id for change in changes if change.rating_delta() != 0],
+                                     self.UPDATE_BATCH_SIZE)
+        return changes
+
+    def update_standings(self, player_ids=None, rank=True):
         """
-        Normalizes groups by making them having even number of players each (except the last one).
-        :param groups: list of groups
-        :type groups: list
-        :returns: normalized list of groups
-        :rtype: list
+        Recomputes standings of the players from their scores in this tournament and re-ranks the players.
+        :param player_ids: ids of the players affected by the score changes. If given - only their rows are updated,
+        otherwise all the standings are rebuilt
+        :type player_ids: Iterable
+        :param rank: whether to re-rank the players. Changes of the single games leave it to the stage saving them,
+        as ranking takes all the scores of the tournament
+        :type rank: bool
         """
-        for (i, group) in enumerate(groups):
-            if len(group) % 2 != 0 and i < len(groups) - 1:
-                groups[i + 1].insert(0, group.pop())
-
-        return filter(lambda g: len(g) > 0, groups)
-
-    def group_players(self):
+        from .models import Score, Standing
+
+        scores = Score.objects.filter(game__round__tournament=self)
+        rebuild = player_ids is None
+        if not rebuild:
+            player_ids = filter(None, set(player_ids))
+            scores = scores.filter(player__in=player_ids)
+            player_ids = self.players.filter(pk__in=player_ids).values_list('id', flat=True)
+        else:
+            player_ids = self.players.values_list('id', flat=True)
+
+        rows = dict((player_id, Standing(tournament=self, player_id=player_id)) for player_id in player_ids)
+        for (player_id, side, score, rating_delta, white, black) in scores.values_list(
+                'player', 'side', 'score', 'rating_delta', 'game__white', 'game__black').iterator():
+            standing = rows.get(player_id)
+            if standing is None:
+                continue
+            standing.points += score
+            standing.rating_delta += rating_delta
+            standing.games_played += 1
+            if white is not None and black is not None:
+                if side == Side.WHITE:
+                    standing.whites += 1
+                else:
+                    standing.blacks += 1
+
+        with transaction.commit_on_success():
+            if rebuild:
+                Standing.objects.filter(tournament=self).delete()
+                Standing.objects.bulk_create(rows.values())
+            else:
+                # Rows are updated in place, keeping the ranks of the players until they are re-ranked.
+                ids = dict(Standing.objects.filter(tournament=self, player__in=rows.keys())
+                           .values_list('player', 'id'))
+                update_columns(Standing, ('points', 'rating_delta', 'games_played', 'whites', 'blacks'),
+                               [(row.points, row.rating_delta, row.games_played, row.whites, row.blacks, ids[player_id])
+                                for (player_id, row) in rows.iteritems() if player_id in ids],
+                               self.UPDATE_BATCH_SIZE)
+                Standing.objects.bulk_create([row for (player_id, row) in rows.iteritems() if player_id not in ids])
+            if rank:
+                self.update_ranks()
+            self.touch()
+
+    def update_ranks(self):
         """
-        Groups players by current tournament score and sorts them by score/rating inside those groups.
-        :returns: list of lists of players
-        :rtype: list
+        Ranks the standings by rating before the first game is scored and by current tournament score, tiebreaks
+        and rating in all the following rounds. Only the changed ranks are written.
         """
+        from .models import Standing
+
+        standings = list(self.standing_set.values_list('id', 'player', 'rank', 'points', 'games_played',
+                                                       'player__rating'))
+        if any(standing[4] for standing in standings):
+            tiebreaks = self.get_tiebreaks()
+            compare_key = lambda standing: ((-standing[3],) + tuple(-value for value in tiebreaks.get_key(standing[1]))
+                                            + (-standing[5], standing[1]))
+        else:
+            compare_key = lambda standing: (-standing[5], standing[1])
 
-        return [self.sort_players(igroup) for score, igroup in itertools.groupby(self.sort_players(), self.get_player_summary_score)]
-
-    def get_player_summary_score(self, player):
-        return self.get_player_scores(player).aggregate(models.Sum('score')).get('score__sum') or 0.0
+        ranks = [(new_rank, standing[0]) for (new_rank, standing) in enumerate(sorted(standings, key=compare_key), 1)
+                 if standing[2] != new_rank]
+        update_column(Standing, 'rank', ranks, self.UPDATE_BATCH_SIZE)
 
-    def get_tournament_pairs(self):
+    def get_standings(self):
         """
-        Returns permutations of pairs already been played in this tournament.
-        :rtype: set
+        Returns current standings snapshot.
+        :rtype: Standings
         """
-        pairs = set((game.white, game.black) for game in self.get_games().all())
-        return pairs | set(map(tuple, map(reversed, pairs)))
+        return Standings(self)
 
-    def pair_players_group(self, group):
+    def get_rounds(self):
         """
-        Returns list of player pairs.
-        :param group: list of grouped players
-        :type group: list
+        Returns the tournament rounds with their games and the games players prefetched in two queries.
+        :returns: list of rounds, their games are available as `games` attribute
         :rtype: list
         """
-        pairs = []
-        group = group[:]
-        players_count = len(group)
-        opponents = group[players_count / 2:] + group[:players_count / 2]
-        excluding_permutations = self.get_tournament_pairs()
+        from .models import Game
 
-        for (i, player) in enumerate(group):
-            opponent = opponents[i]
-            opponent = opponent if player is not opponent else None
+        rounds = list(self.round_set.order_by('start_date', 'id'))
+        games = dict((round_id, list(round_games)) for (round_id, round_games) in itertools.groupby(
+            Game.objects.filter(round__tournament=self).select_related('white', 'black').order_by('round', 'id'),
+            operator.attrgetter('round_id')))
+        for tournament_round in rounds:
+            tournament_round.games = games.get(tournament_round.pk, [])
+        return rounds
 
-            if (player, opponent) in excluding_permutations:
-                try:
-                    opponent = next(
-                        itertools.ifilter(lambda o: player is not o and (player, o) not in excluding_permutations,
-                                          opponents))
-                except StopIteration:
-                    opponent = None
-            excluding_permutations.update({(player, opponent), (opponent, player)})
-            pairs.append((player, opponent))
+    def get_tiebreaks(self):
+        """
+        Returns tiebreaks of the players, computed from the tournament scores loaded with a single query.
+        :rtype: Tiebreaks
+        """
+        from .models import Score
+
+        # Scores of each game are consecutive, the opponent of each side is the player of the other one.
+        results = []
+        scores = Score.objects.filter(game__round__tournament=self).order_by('game__round', 'game') \
+            .values_list('game__round', 'game', 'player', 'score')
+        for (game_id, game_scores) in itertools.groupby(scores.iterator(), operator.itemgetter(1)):
+            game_scores = list(game_scores)
+            for (round_id, game_id, player_id, score) in game_scores:
+                opponents = [side[2] for side in game_scores if side[2] != player_id]
+                results.append((round_id, player_id, opponents[0] if opponents else None, score))
 
-        return pairs
+        return Tiebreaks(self.players.values_list('id', flat=True), results)
 
-    def get_played_sides(self, pair):
+    def get_pairing_state(self, standings=None):
         """
-        Returns dict of dicts, countaining played games number for each side: { player: { color: games_count } }.
-        :param pair: pair of players
-        :type pair: tuple
-        :rtype: dict
+        Builds the compact tournament state used by the pairing engine.
+        :param standings: standings snapshot. If missing - will use self.get_standings()
+        :type standings: Standings
+        :rtype: TournamentState
         """
-        past_games = {}
+        if standings is None:
+            standings = self.get_standings()
 
-        for player in pair:
-            if player is not None:
-                past_games_white = player.game_set_white.filter(round__tournament=self).count()
-                past_games_black = player.game_set_black.filter(round__tournament=self).count()
-            past_games.update({player: {Side.WHITE: past_games_white, Side.BLACK: past_games_black}})
+        ids, ratings = zip(*self.players.values_list('id', 'rating')) or ((), ())
+        state = TournamentState(ids=ids,
+                                scores=[standings.scores.get(player_id) or 0.0 for player_id in ids],
+                                ratings=ratings)
 
-        return past_games
+        # Played pairs and color history of all the players are built from a single query over the games.
+        for (white, black) in self.get_games().order_by('round', 'id').values_list('white', 'black'):
+            state.add_game(white, black)
+        return state
 
-    def map_colors(self, pair):
+    def pair_players(self, state=None, seed=None):
         """
-        Returns dict of { color: player } entries.
-        :param pair: pair of players
-        :type pair: tuple
-        :rtype: dict
+        Returns list of (white id, black id) pairs for the next round. Bye is represented by None.
+        :param state: tournament state. If missing - will use self.get_pairing_state()
+        :type state: TournamentState
+        :param seed: seed of the random numbers generator used to resolve colors
+        :type seed: int
+        :returns: list of player id pairs
+        :rtype: list
         """
-        past_games = self.get_played_sides(pair)
+        if state is None:
+            state = self.get_pairing_state()
+        return self.get_pairing_engine(state, seed).pair()
 
-        if past_games[pair[0]][Side.WHITE] < past_games[pair[1]][Side.WHITE]:
-            resulting_pair = pair
-        elif past_games[pair[0]][Side.BLACK] < past_games[pair[1]][Side.BLACK]:
-            resulting_pair = reversed(pair)
-        else:
-            resulting_pair = random.sample(pair, 2)
-
-        return dict(zip(
-            (Side.WHITE, Side.BLACK),
-            resulting_pair
-        ))
+    def get_pairing_engine(self, state, seed=None):
+        """
+        Returns pairing engine selected for this tournament.
+        :param state: tournament state
+        :type state: TournamentState
+        :param seed: seed of the random numbers generator used to resolve colors
+        :type seed: int
+        :rtype: SwissPairing
+        """
+        engine_class = MatchingPairing if self.pairing == Pairings.MATCHING else SwissPairing
+        return engine_class(state, random.Random(seed))
 
-    def sort_players(self, players=None):
+    def sort_players(self, players=None, standings=None):
         """
         Sorts the players by their rating in the first round and by current tournament score in all the following ones.
         :param players: players iterable. If missing - will use self.players.all()
         :type players: Iterable
+        :param standings: standings snapshot. If missing - will use self.get_standings()
+        :type standings: Standings
         :rtype: list
         """
         if players is None:
             players = self.players.all()
-        if self.get_finished_games().count() == 0:
-            compare_key = operator.attrgetter('rating')
-        else:
-            compare_key = self.get_player_summary_score
-        return sorted(players, reverse=True, key=compare_key)
+        if standings is None:
+            standings = self.get_standings()
+        return standings.sort(players)
@@ -2,10 +2,20 @@
 from django.conf.urls import patterns, url
 from django.views import generic
 
-from . import views
+from . import api, views
 
 urlpatterns = patterns('',
                        url(r'^$', generic.RedirectView.as_view(url='tournaments/'), name='index'),
                        url(r'^tournaments/$', views.TournamentListView.as_view(), name='tournament_list'),
                        url(r'^tournaments/(?P<pk>\d+)/$', views.TournamentDetailView.as_view(), name='tournament_detail'),
+                       url(r'^tournaments/export\.(?P<export_format>pgn|csv|trf)$',
+                           views.TournamentExportView.as_view(), name='tournament_export'),
+                       url(r'^tournaments/(?P<pk>\d+)/export\.(?P<export_format>pgn|csv|trf)$',
+                           views.TournamentExportView.as_view(), name='tournament_detail_export'),
+                       url(r'^api/tournaments/(?P<pk>\d+)/$', api.tournament, name='api_tournament'),
+                       url(r'^api/tournaments/(?P<pk>\d+)/rounds/$', api.rounds, name='api_rounds'),
+                       url(r'^api/tournaments/(?P<pk>\d+)/rounds/(?P<round_pk>\d+)/$', api.pairings,
+                           name='api_pairings'),
+                       url(r'^api/tournaments/(?P<pk>\d+)/standings/$', api.standings, name='api_standings'),
+                       url(r'^profiling/$', views.ProfilingView.as_view(), name='profiling'),
                        )
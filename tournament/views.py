@@ -1,27 +1,154 @@
 # -*- encoding: utf-8 -*-
+import json
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.db import models
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.decorators import method_decorator
 from django.views import generic
 
+from . import cache as tournament_cache
+from .exports import export
+from .forms import TournamentFilterForm
 from .models import Tournament
+from .profiling import REQUEST_LOG, get_sample_rate
+
+
+class CachedResponseMixin(object):
+    """
+    Caches status, headers and content of the rendered response under the key returned by get_cache_key, which
+    the views must define.
+    """
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_cache_key()
+        cached = cache.get(key)
+        if cached is None:
+            response = super(CachedResponseMixin, self).get(request, *args, **kwargs)
+            response.render()
+            cache.set(key, (response.status_code, response.items(), response.content), self.get_cache_timeout())
+            return response
 
+        status, headers, content = cached
+        response = HttpResponse(content, status=status)
+        for (header, value) in headers:
+            response[header] = value
+        return response
 
-class TournamentListView(generic.ListView):
+    def get_cache_timeout(self):
+        return tournament_cache.LIVE_TIMEOUT
+
+
+class TournamentListView(CachedResponseMixin, generic.ListView):
     context_object_name = 'tournaments'
+    page_size = 50
 
     def get_queryset(self):
-        return Tournament.objects.order_by('-start_date')
+        self.form = TournamentFilterForm(self.request.GET)
+        queryset = Tournament.objects.select_related('referee__user')
+        if self.form.is_valid():
+            queryset = self.form.filter(queryset)
+        return queryset.order_by('-start_date', '-id')
+
+    def get_cache_key(self):
+        return tournament_cache.get_list_key(self.request.GET.urlencode())
+
+    def get_context_data(self, **kwargs):
+        # One extra tournament is read to know whether there is a next page.
+        tournaments = list(kwargs.pop('object_list', self.object_list)[:self.page_size + 1])
+        next_page = None
+        if len(tournaments) > self.page_size:
+            tournaments = tournaments[:self.page_size]
+            query = self.request.GET.copy()
+            query['before'] = TournamentFilterForm.get_cursor(tournaments[-1])
+            next_page = u'?' + query.urlencode()
+
+        # Players are counted for the page only, so the page itself is read from the (start_date, id) index.
+        page = [tournament.pk for tournament in tournaments]
+        totals = dict(Tournament.players.through.objects.filter(tournament__in=page).values('tournament')
+                      .annotate(players_total=models.Count('id')).values_list('tournament', 'players_total'))
+        for tournament in tournaments:
+            tournament.players_total = totals.get(tournament.pk, 0)
+
+        first_page = None
+        if 'before' in self.request.GET:
+            query = self.request.GET.copy()
+            del query['before']
+            first_page = u'?' + query.urlencode()
+
+        context = super(TournamentListView, self).get_context_data(object_list=tournaments, **kwargs)
+        context.update(form=self.form, next_page=next_page, first_page=first_page)
+        return context
 
 
-class TournamentDetailView(generic.DetailView):
-    model = Tournament
+class TournamentDetailView(CachedResponseMixin, generic.DetailView):
+    queryset = Tournament.objects.select_related('referee__user')
     context_object_name = 'tournament'
 
+    def get_object(self, queryset=None):
+        # The tournament is loaded once for both the cache key and the page itself.
+        if getattr(self, 'object', None) is None:
+            self.object = super(TournamentDetailView, self).get_object(queryset)
+        return self.object
+
+    def get_cache_key(self):
+        return tournament_cache.get_detail_key(self.get_object())
+
+    def get_cache_timeout(self):
+        return tournament_cache.get_timeout(self.get_object())
+
     def get_context_data(self, **kwargs):
         context = super(TournamentDetailView, self).get_context_data(**kwargs)
         tournament = context.get(self.context_object_name)
 
-        players = tournament.sort_players()
-        for player in players:
-            player.score = tournament.get_player_summary_score(player)
-
-        context.update(players=players)
+        # Everything the template shows is loaded here in a fixed number of queries, regardless of the tournament size.
+        context.update(rounds=tournament.get_rounds(),
+                       players=tournament.get_standings().get_players(tournament.get_tiebreaks()))
         return context
+
+
+class TournamentExportView(generic.View):
+    """
+    Streams games of the tournament, or of the tournaments matching TournamentFilterForm if no tournament is given.
+    """
+
+    def get(self, request, export_format, pk=None):
+        tournaments = Tournament.objects.all()
+        if pk is not None:
+            tournaments = tournaments.filter(pk=pk)
+            if not tournaments.exists():
+                raise Http404()
+        else:
+            form = TournamentFilterForm(request.GET)
+            if not form.is_valid():
+                return HttpResponseBadRequest(form.errors.as_text(), content_type='text/plain')
+            tournaments = form.filter(tournaments)
+
+        chunks, content_type = export(tournaments, export_format)
+        response = StreamingHttpResponse(chunks, content_type='%s; charset=utf-8' % content_type)
+        filename = 'tournament-%s' % pk if pk is not None else 'tournaments'
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (filename, export_format)
+        return response
+
+
+class ProfilingView(generic.View):
+    """
+    Staff only JSON report of the requests profiled by ProfilingMiddleware in this process. The latest profiles are
+    included as well if `recent` parameter gives their number.
+    """
+
+    @method_decorator(staff_member_required)
+    def dispatch(self, request, *args, **kwargs):
+        return super(ProfilingView, self).dispatch(request, *args, **kwargs)
+
+    def get(self, request):
+        report = REQUEST_LOG.aggregate()
+        report['sample_rate'] = get_sample_rate()
+        try:
+            recent = int(request.GET.get('recent', 0))
+        except ValueError:
+            return HttpResponseBadRequest('Invalid number of the recent requests', content_type='text/plain')
+        if recent > 0:
+            report['recent'] = list(REQUEST_LOG.records)[-recent:]
+        return HttpResponse(json.dumps(report, indent=2), content_type='application/json')